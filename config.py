@@ -1,13 +1,15 @@
 """
 配置管理模块
 支持通过环境变量覆盖默认配置
+
+配置对象在导入时构建一次（环境变量只读取一次），之后不可修改
 """
 import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import FrozenSet
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VLLMConfig:
     """vLLM服务配置"""
     api_base: str = field(default_factory=lambda: os.getenv("VLLM_API_BASE", "http://192.168.1.100:8000/v1"))
@@ -16,7 +18,7 @@ class VLLMConfig:
     model_name: str = field(default_factory=lambda: os.getenv("VLLM_MODEL_NAME", "openai/qwen-2.5-coder-32b"))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitConfig:
     """Git平台配置"""
     token: str = field(default_factory=lambda: os.getenv("GIT_TOKEN", ""))
@@ -29,36 +31,68 @@ class GitConfig:
     server_url: str = field(default_factory=lambda: os.getenv("GIT_SERVER_URL", ""))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AiderConfig:
     """Aider配置"""
     map_tokens: int = field(default_factory=lambda: int(os.getenv("AIDER_MAP_TOKENS", "2048")))
     no_repo_map: bool = field(default_factory=lambda: os.getenv("AIDER_NO_REPO_MAP", "false").lower() == "true")
-    # 支持的代码文件扩展名
-    valid_extensions: List[str] = field(default_factory=lambda: [
+    # 支持的代码文件扩展名（frozenset，便于O(1)成员判断）
+    valid_extensions: FrozenSet[str] = field(default_factory=lambda: frozenset({
         '.py', '.js', '.ts', '.jsx', '.tsx',
         '.java', '.go', '.cpp', '.c', '.h',
         '.rs', '.rb', '.php', '.cs', '.swift',
         '.kt', '.scala', '.vue', '.svelte'
-    ])
+    }))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ServerConfig:
     """服务器配置"""
     host: str = field(default_factory=lambda: os.getenv("SERVER_HOST", "0.0.0.0"))
     port: int = field(default_factory=lambda: int(os.getenv("SERVER_PORT", "5000")))
     work_dir_base: str = field(default_factory=lambda: os.getenv("WORK_DIR_BASE", "/tmp/aider_reviewer"))
+    # 仓库镜像缓存目录（每个仓库一个裸仓库，审查任务以 worktree 方式检出）
+    repo_cache_dir: str = field(default_factory=lambda: os.getenv("REPO_CACHE_DIR", "/tmp/aider_repo_cache"))
     log_level: str = field(default_factory=lambda: os.getenv("LOG_LEVEL", "INFO"))
+    # 同时执行的审查任务数（每个任务运行一个Aider子进程并占用模型推理资源）
+    max_review_workers: int = field(default_factory=lambda: int(os.getenv("MAX_REVIEW_WORKERS", "2")))
+    # 等待执行的审查任务上限，超出时拒绝新任务（HTTP 429）
+    review_queue_size: int = field(default_factory=lambda: int(os.getenv("REVIEW_QUEUE_SIZE", "100")))
+    # 同一仓库分支排队中的 Commit 审查合并为一次执行的最大提交数，1 表示不合并
+    review_batch_size: int = field(default_factory=lambda: int(os.getenv("REVIEW_BATCH_SIZE", "10")))
+
+
+@dataclass(frozen=True, slots=True)
+class DatabaseConfig:
+    """数据库配置"""
+    # SQLite内存映射大小（字节），32位环境可设为0禁用
+    mmap_size: int = field(default_factory=lambda: int(os.getenv("SQLITE_MMAP_SIZE", "536870912")))
+    # WAL文件大小上限（字节），检查点后截断到此大小
+    journal_size_limit: int = field(default_factory=lambda: int(os.getenv("SQLITE_JOURNAL_SIZE_LIMIT", "67108864")))
+    # 慢查询日志阈值（毫秒），0 表示关闭
+    slow_query_ms: int = field(default_factory=lambda: int(os.getenv("SLOW_QUERY_MS", "100")))
+    # 常驻连接数（不创建溢出连接），并发审查线程较多时可调大
+    pool_size: int = field(default_factory=lambda: int(os.getenv("DB_POOL_SIZE", "5")))
+    # 连接全部被占用时的等待时间（秒）
+    pool_timeout: int = field(default_factory=lambda: int(os.getenv("DB_POOL_TIMEOUT", "30")))
+
+
+@dataclass(frozen=True, slots=True)
+class PollingConfig:
+    """轮询配置"""
+    # 并发检查仓库的最大线程数（git ls-remote 子进程等待期间不占用GIL，仓库较多时可调大）
+    max_workers: int = field(default_factory=lambda: int(os.getenv("POLLING_MAX_WORKERS", "16")))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AppConfig:
     """应用总配置"""
     vllm: VLLMConfig = field(default_factory=VLLMConfig)
     git: GitConfig = field(default_factory=GitConfig)
     aider: AiderConfig = field(default_factory=AiderConfig)
     server: ServerConfig = field(default_factory=ServerConfig)
+    database: DatabaseConfig = field(default_factory=DatabaseConfig)
+    polling: PollingConfig = field(default_factory=PollingConfig)
     version: str = "1.0.0"
 
 
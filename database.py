@@ -3,12 +3,14 @@
 """
 import os
 import logging
+import time
 from contextlib import contextmanager
-from sqlalchemy import create_engine, event
+from typing import List
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
 
-from models import Base
+from models import Base, ReviewIssue
 from config import config
 
 logger = logging.getLogger("aider-reviewer")
@@ -24,14 +26,19 @@ DATABASE_PATH = os.path.join(
 os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
 
 # 创建数据库引擎（带连接池配置）
+# SQLite同一时刻只允许一个写者：连接池只保留WAL并发读所需的常驻连接，
+# 不再临时扩容（避免频繁开关文件和写锁争抢），写冲突时由busy timeout排队等待
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},  # SQLite需要此配置
+    connect_args={
+        "check_same_thread": False,  # SQLite需要此配置
+        "timeout": 30,               # 写锁被占用时等待（秒），而不是立即报 database is locked
+    },
     poolclass=QueuePool,
-    pool_size=5,          # 连接池大小
-    max_overflow=10,      # 最大溢出连接数
-    pool_timeout=30,      # 连接超时（秒）
+    pool_size=max(1, config.database.pool_size),  # 连接池大小
+    max_overflow=0,       # 不创建溢出连接
+    pool_timeout=config.database.pool_timeout,    # 连接超时（秒）
     pool_recycle=3600,    # 连接回收时间（秒）
     echo=False            # 设为True可查看SQL日志
 )
@@ -43,8 +50,41 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.execute("PRAGMA journal_mode=WAL")     # 写前日志模式，提高并发性能
     cursor.execute("PRAGMA synchronous=NORMAL")   # 平衡性能和安全
     cursor.execute("PRAGMA cache_size=-64000")    # 64MB缓存
+    cursor.execute("PRAGMA temp_store=MEMORY")    # 临时表/排序使用内存
+    cursor.execute(f"PRAGMA journal_size_limit={config.database.journal_size_limit}")  # 限制WAL文件大小
+    cursor.execute("PRAGMA wal_autocheckpoint=1000")  # 每约1000页（4MB）WAL自动检查点，避免WAL无限增长拖慢读取
+    if config.database.mmap_size > 0:
+        cursor.execute(f"PRAGMA mmap_size={config.database.mmap_size}")  # 内存映射读取，减少read()系统调用
     cursor.close()
 
+
+@event.listens_for(engine, "checkin")
+def optimize_on_checkin(dbapi_connection, connection_record):
+    """连接归还连接池时执行 PRAGMA optimize，按需刷新查询规划器统计信息（通常为空操作）"""
+    if dbapi_connection is None:
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA optimize")
+        cursor.close()
+    except Exception as e:
+        logger.debug(f"PRAGMA optimize 失败: {e}")
+
+if config.database.slow_query_ms > 0:
+    _SLOW_QUERY_SECONDS = config.database.slow_query_ms / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+        """记录超过阈值的慢查询"""
+        elapsed = time.perf_counter() - conn.info["query_start"]
+        if elapsed >= _SLOW_QUERY_SECONDS:
+            logger.warning(f"慢查询 {elapsed * 1000:.0f}ms: {statement[:500]}")
+
+
 # 创建Session工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -52,7 +92,17 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 def init_database():
     """初始化数据库，创建所有表"""
     Base.metadata.create_all(bind=engine)
-    logger.info(f"数据库初始化完成: {DATABASE_PATH}")
+    # create_all 不会给已存在的表补建新索引，逐个检查补齐（旧数据库迁移）
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    # 确认连接钩子中的PRAGMA已生效（某些文件系统不支持WAL时会静默回退）
+    with engine.connect() as conn:
+        journal_mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+    if str(journal_mode).lower() != 'wal':
+        logger.warning(f"SQLite未启用WAL模式（当前: {journal_mode}），并发读写性能会下降")
+    logger.info(f"数据库初始化完成: {DATABASE_PATH} (journal_mode={journal_mode})")
 
 
 def get_db():
@@ -78,3 +128,26 @@ def get_db_session():
     finally:
         db.close()
 
+
+def bulk_insert_issues(db: Session, review_id: int, issues: List[dict]) -> int:
+    """
+    批量写入审查问题详情
+    
+    使用单条INSERT语句执行多行写入（executemany），在调用方的事务中提交。
+    同一审查的所有问题应一次性传入，不要逐条 review.issues.append(...)
+    
+    Args:
+        db: 数据库Session（通常来自 get_db_session）
+        review_id: 关联的 ReviewRecord.id
+        issues: ReviewIssue 列字段组成的字典列表
+    
+    Returns:
+        写入的问题数量
+    """
+    if not issues:
+        return 0
+    db.execute(
+        ReviewIssue.__table__.insert(),
+        [{**issue, 'review_id': review_id} for issue in issues]
+    )
+    return len(issues)
@@ -4,7 +4,7 @@
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, ForeignKey, Enum as SQLEnum
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Index, JSON, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -37,6 +37,14 @@ class IssueSeverity(enum.Enum):
 class ReviewRecord(Base):
     """审查记录表"""
     __tablename__ = 'review_records'
+    __table_args__ = (
+        # 仪表盘常用的 过滤+按时间排序 组合查询
+        Index('ix_rr_project_status_created', 'project_id', 'status', 'created_at'),
+        Index('ix_rr_author_created', 'author_name', 'created_at'),
+        Index('ix_rr_status_created', 'status', 'created_at'),
+        # 无过滤条件的按时间排序列表、按日期范围统计
+        Index('ix_rr_created', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     
@@ -64,7 +72,7 @@ class ReviewRecord(Base):
     
     # 审查内容
     files_count = Column(Integer, default=0)
-    files_reviewed = Column(Text)  # JSON list of files
+    files_reviewed = Column(JSON)  # 文件列表（SQLite 下仍以 JSON 文本存储，兼容旧数据）
     
     # 审查结果
     report = Column(Text)
@@ -130,6 +138,9 @@ class ReviewRecord(Base):
 class ReviewIssue(Base):
     """审查发现的问题详情表"""
     __tablename__ = 'review_issues'
+    __table_args__ = (
+        Index('ix_ri_review_severity', 'review_id', 'severity'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     
@@ -166,3 +177,53 @@ class ReviewIssue(Base):
             'category': self.category,
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
+
+
+class PollingRepoRow(Base):
+    """轮询仓库配置表（每个仓库一行，字段与 polling.PollingRepo 一致）"""
+    __tablename__ = 'polling_repos'
+
+    id = Column(String(36), primary_key=True)
+    name = Column(String(200))
+    url = Column(String(500))
+    branch = Column(String(200))
+    
+    # 平台和认证配置
+    platform = Column(String(20))
+    auth_type = Column(String(20))
+    http_user = Column(String(200))
+    http_password = Column(String(500))
+    token = Column(String(500))
+    api_url = Column(String(500))
+    
+    # 存储配置
+    local_path = Column(String(500))
+    
+    # 轮询模式配置
+    strategy = Column(String(20))
+    poll_commits = Column(Boolean)
+    poll_mrs = Column(Boolean)
+    effective_time = Column(String(40))
+    
+    # Webhook模式配置
+    webhook_commits = Column(Boolean)
+    webhook_mrs = Column(Boolean)
+    webhook_branches = Column(String(500))
+    
+    polling_interval = Column(Integer)
+    enable_comment = Column(Boolean)
+    
+    # 状态信息
+    last_commit_id = Column(String(40))
+    last_mr_id = Column(Integer)
+    last_check_time = Column(String(40))
+    enabled = Column(Boolean)
+    clone_status = Column(String(20))
+    
+    # 触发模式配置
+    trigger_mode = Column(String(20))
+    webhook_secret = Column(String(500))
+    
+    def to_dict(self):
+        """转换为字典（键与 PollingRepo 字段一致）"""
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
@@ -2,20 +2,74 @@
 轮询管理器模块
 定时轮询 Git 仓库，检查新提交和 MR，自动触发代码审查
 """
+import os
 import threading
 import time
+import hashlib
 import json
 import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Callable
-from dataclasses import dataclass, asdict
-import requests
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Callable, Set, Tuple
+from dataclasses import dataclass, field, fields, replace
+from sqlalchemy import bindparam
 
+from config import config
+from database import engine, get_db_session
+from models import PollingRepoRow
 from settings import SettingsManager
 from utils import logger, convert_to_http_auth_url, extract_project_path
 
+# ls-remote 输出中的MR refs行: <sha>\trefs/merge-requests/<id>/head 或 <sha>\trefs/pull/<id>/head
+# 按字节匹配，直接处理 ls-remote 的原始输出，无需先解码
+_MR_REF_RE = re.compile(rb'^[0-9a-f]{40,64}\t(refs/(?:merge-requests|pull)/(\d+)/head)$', re.M)
 
-@dataclass
+
+def _build_git_env() -> Dict[str, str]:
+    """
+    构建git网络命令的环境变量
+    SSH 使用连接多路复用（ControlMaster），同一主机的多次 ls-remote 复用已建立的连接；
+    用户已自定义 GIT_SSH_COMMAND 时保持不变
+    """
+    env = dict(os.environ)
+    if 'GIT_SSH_COMMAND' not in env:
+        control_path = os.path.join(tempfile.gettempdir(), 'aider-ssh-%C')
+        env['GIT_SSH_COMMAND'] = (
+            f'ssh -o ControlMaster=auto -o ControlPath={control_path} -o ControlPersist=10m'
+        )
+    # 后台服务没有终端，认证失败时直接报错而不是等待输入
+    env.setdefault('GIT_TERMINAL_PROMPT', '0')
+    return env
+
+
+_GIT_ENV = _build_git_env()
+
+# 各平台的MR refs模式，GitHub/Gitea 及未知平台使用 refs/pull
+_PLATFORM_MR_REFS = {
+    'gitlab': 'refs/merge-requests/*/head',
+    'github': 'refs/pull/*/head',
+    'gitea': 'refs/pull/*/head',
+}
+_DEFAULT_MR_REFS = 'refs/pull/*/head'
+
+# git网络命令的公共参数：HTTP 优先协商 HTTP/2（服务器不支持时自动回退）
+_GIT_NET_ARGS = ('-c', 'http.version=HTTP/2')
+
+
+@lru_cache(maxsize=1024)
+def _parse_effective_time(value: str) -> Optional[datetime]:
+    """解析仓库的生效时间（ISO格式），结果按字符串缓存，每次轮询不再重复解析"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        logger.warning(f"无效的生效时间格式: {value}")
+        return None
+
+
+@dataclass(slots=True)
 class PollingRepo:
     """轮询仓库配置"""
     id: str
@@ -62,8 +116,45 @@ class PollingRepo:
     trigger_mode: str = "polling" # 触发模式: polling / webhook / both
     webhook_secret: str = ""      # Webhook密钥（用于验证webhook请求）
     
+    # 运行时状态（不持久化，不参与 to_dict）
+    _last_poll_ts: float = field(default=0.0, init=False, repr=False, compare=False)     # 上次轮询时间戳
+    _interval_seconds: float = field(default=0.0, init=False, repr=False, compare=False)  # 轮询间隔（秒）
+    _backoff: int = field(default=1, init=False, repr=False, compare=False)                # 连续失败退避倍数
+    
+    def __post_init__(self):
+        self._interval_seconds = self.polling_interval * 60
+    
     def to_dict(self):
-        return asdict(self)
+        # 显式构造字典，避免 asdict 的递归深拷贝（所有字段均为不可变标量）
+        return {
+            'id': self.id,
+            'name': self.name,
+            'url': self.url,
+            'branch': self.branch,
+            'platform': self.platform,
+            'auth_type': self.auth_type,
+            'http_user': self.http_user,
+            'http_password': self.http_password,
+            'token': self.token,
+            'api_url': self.api_url,
+            'local_path': self.local_path,
+            'strategy': self.strategy,
+            'poll_commits': self.poll_commits,
+            'poll_mrs': self.poll_mrs,
+            'effective_time': self.effective_time,
+            'webhook_commits': self.webhook_commits,
+            'webhook_mrs': self.webhook_mrs,
+            'webhook_branches': self.webhook_branches,
+            'polling_interval': self.polling_interval,
+            'enable_comment': self.enable_comment,
+            'last_commit_id': self.last_commit_id,
+            'last_mr_id': self.last_mr_id,
+            'last_check_time': self.last_check_time,
+            'enabled': self.enabled,
+            'clone_status': self.clone_status,
+            'trigger_mode': self.trigger_mode,
+            'webhook_secret': self.webhook_secret,
+        }
     
     def get_local_path(self) -> str:
         """获取本地存储路径"""
@@ -74,60 +165,189 @@ class PollingRepo:
     
     @classmethod
     def from_dict(cls, data: dict):
-        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+        # 常见情况（数据库行/to_dict结果）键完全匹配，直接构造，无需逐项过滤
+        if data.keys() <= _POLLING_REPO_INIT_FIELDS:
+            return cls(**data)
+        return cls(**{k: v for k, v in data.items() if k in _POLLING_REPO_INIT_FIELDS})
+
+
+# 可通过构造函数传入的字段名（不含运行时状态字段），类创建后计算一次
+_POLLING_REPO_INIT_FIELDS = frozenset(f.name for f in fields(PollingRepo) if f.init)
 
 
 class PollingManager:
-    """轮询任务管理器"""
+    """
+    轮询任务管理器
     
-    _instance = None
-    _lock = threading.Lock()
+    应用内通过模块级实例 polling_manager 使用；导入模块不访问数据库，
+    服务启动时由 lifespan 调用 load() 加载仓库配置并 start() 启动后台线程
+    """
     
-    def __new__(cls):
-        if cls._instance is None:
-            with cls._lock:
-                if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance._initialized = False
-        return cls._instance
+    _FLUSH_INTERVAL = 2  # 仓库状态合并写入窗口（秒）
+    _MAX_BACKOFF = 16    # 连续失败时轮询间隔的最大放大倍数
     
     def __init__(self):
-        if self._initialized:
-            return
-        
-        self._initialized = True
-        self._running = True  # 现在默认常驻运行
+        self._running = False
+        self._stop_event = threading.Event()  # stop() 时置位，用于可中断的等待
+        self._wakeup = threading.Event()  # 仓库新增或配置变化时置位，立即开始下一轮扫描
         self._thread: Optional[threading.Thread] = None
         self._repos: Dict[str, PollingRepo] = {}
+        self._enabled_ids: Set[str] = set()  # 已启用仓库的ID索引，轮询只遍历这部分
+        # 只读视图（写时复制）：所有修改在锁内完成后整体替换，读取方无需加锁
+        self._repos_view: Mapping[str, PollingRepo] = MappingProxyType({})
+        self._enabled_view: Tuple[PollingRepo, ...] = ()
         self._repos_lock = threading.RLock()
         self._review_callback: Optional[Callable] = None
-        self._last_poll_times: Dict[str, float] = {}
-        self._load_repos()
-        
-        # 自动启动后台线程
-        self.start()
+        self._dirty_ids: Set[str] = set()  # 轮询状态有未持久化变更的仓库
+        self._flush_event = threading.Event()  # 有脏数据时置位，唤醒合并写入线程
+        self._flusher: Optional[threading.Thread] = None
+        # 上次 ls-remote MR refs 输出的SHA256摘要，键为 "{repo_id}:mrs"；远端 refs 未变化时跳过解析（类似 ETag）
+        self._etags: Dict[str, bytes] = {}
+        # 全局配置快照，配置版本号变化或超过最长缓存时间时刷新
+        self._settings_snapshot: Dict[str, str] = {}
+        self._settings_version = -1
+        self._settings_time = 0.0
+        # 认证URL缓存，键为 repo_id，值为 (认证相关字段, URL)
+        self._auth_urls: Dict[str, Tuple[tuple, str]] = {}
+        # 仓库检查以网络I/O为主（线程阻塞在子进程上，不持有GIL），使用有界线程池并发执行
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, config.polling.max_workers),
+            thread_name_prefix="poll"
+        )
+        self._loaded = False
     
     def set_review_callback(self, callback: Callable):
         """设置审查回调函数"""
         self._review_callback = callback
     
+    def load(self):
+        """从数据库加载仓库配置（只加载一次，start() 前需已调用或由 start() 自动调用）"""
+        with self._repos_lock:
+            if self._loaded:
+                return
+            self._load_repos()
+            self._loaded = True
+    
     def _load_repos(self):
         """从数据库加载仓库配置"""
-        repos_json = SettingsManager.get('polling_repos', '[]')
+        PollingRepoRow.__table__.create(bind=engine, checkfirst=True)
         try:
-            repos_list = json.loads(repos_json)
-            with self._repos_lock:
-                self._repos = {r['id']: PollingRepo.from_dict(r) for r in repos_list}
-        except (json.JSONDecodeError, KeyError) as e:
+            with get_db_session() as db:
+                rows = db.query(PollingRepoRow).all()
+                repos = {row.id: PollingRepo.from_dict(row.to_dict()) for row in rows}
+        except Exception as e:
             logger.warning(f"加载仓库配置失败: {e}")
-            with self._repos_lock:
-                self._repos = {}
+            repos = {}
+        
+        if not repos:
+            repos = self._migrate_legacy_repos()
+        
+        with self._repos_lock:
+            self._repos = repos
+            self._enabled_ids = {rid for rid, r in repos.items() if r.enabled}
+            self._publish_view()
+    
+    def _publish_view(self):
+        """根据 _repos 重建只读视图（调用方需持有 _repos_lock）"""
+        self._repos_view = MappingProxyType(dict(self._repos))
+        self._enabled_view = tuple(self._repos[rid] for rid in self._enabled_ids if rid in self._repos)
+    
+    def _migrate_legacy_repos(self) -> Dict[str, PollingRepo]:
+        """将旧版保存在配置项 polling_repos 中的JSON仓库列表迁移到 polling_repos 表"""
+        repos_json = SettingsManager.get('polling_repos', '[]')
+        try:
+            repos_list = json.loads(repos_json or '[]')
+            repos = {r['id']: PollingRepo.from_dict(r) for r in repos_list}
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.warning(f"解析旧版仓库配置失败: {e}")
+            return {}
+        
+        if repos:
+            try:
+                with get_db_session() as db:
+                    for repo in repos.values():
+                        db.merge(PollingRepoRow(**repo.to_dict()))
+            except Exception as e:
+                logger.error(f"迁移轮询仓库配置失败: {e}")
+                return repos
+            # 迁移完成后清空旧配置，避免删除全部仓库后重启时被重新导入
+            SettingsManager.set('polling_repos', '[]')
+            logger.info(f"已迁移 {len(repos)} 个轮询仓库到 polling_repos 表")
+        return repos
+    
+    def _save_repo(self, repo: PollingRepo):
+        """
+        保存单个仓库配置到数据库：锁内只构造行数据，写库在锁外进行，不阻塞轮询线程；
+        按当前对象构造，并发更新时后写入的总是最新配置，仓库已删除则不再写入
+        """
+        with self._repos_lock:
+            current = self._repos.get(repo.id)
+            if current is None:
+                return
+            row = PollingRepoRow(**current.to_dict())
+            self._dirty_ids.discard(repo.id)
+        try:
+            with get_db_session() as db:
+                db.merge(row)
+        except Exception as e:
+            logger.error(f"保存仓库配置失败 {repo.name}: {e}")
+    
+    # 轮询过程中会变化的状态字段；其余配置字段只在增删改时整行保存
+    _STATE_FIELDS = ('last_commit_id', 'last_mr_id', 'last_check_time', 'clone_status')
     
     def _save_repos(self):
-        """保存仓库配置到数据库"""
+        """将所有有未保存变更的仓库状态在一个事务中写入数据库（只更新状态字段）"""
         with self._repos_lock:
-            repos_list = [r.to_dict() for r in self._repos.values()]
-        SettingsManager.set('polling_repos', json.dumps(repos_list, ensure_ascii=False))
+            dirty_ids, self._dirty_ids = self._dirty_ids, set()
+            repos = [self._repos[rid] for rid in dirty_ids if rid in self._repos]
+            params = [
+                {'_id': repo.id, **{f: getattr(repo, f) for f in self._STATE_FIELDS}}
+                for repo in repos
+            ]
+        if not params:
+            return
+        try:
+            table = PollingRepoRow.__table__
+            stmt = table.update().where(table.c.id == bindparam('_id'))
+            with get_db_session() as db:
+                result = db.execute(stmt, params)
+                if result.rowcount != len(params):
+                    # 有仓库行不存在（如新增时保存失败），回退为整行写入
+                    for repo in repos:
+                        db.merge(PollingRepoRow(**repo.to_dict()))
+        except Exception as e:
+            logger.error(f"保存轮询状态失败: {e}")
+            # 保留脏标记，下一轮重试
+            with self._repos_lock:
+                self._dirty_ids.update(dirty_ids)
+    
+    def _mark_dirty(self, repo_id: str):
+        """标记仓库状态待保存，由合并写入线程延迟落库"""
+        with self._repos_lock:
+            self._dirty_ids.add(repo_id)
+        if self._flusher and self._flusher.is_alive():
+            self._flush_event.set()
+        else:
+            # 服务未启动时没有合并写入线程，直接保存
+            self._save_repos()
+    
+    def _flush_loop(self):
+        """合并写入线程：有脏数据时最多每 _FLUSH_INTERVAL 秒落库一次"""
+        while self._running:
+            if not self._flush_event.wait(timeout=1):
+                continue
+            # 等待合并窗口，期间的多次状态变更一起写入
+            self._stop_event.wait(self._FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self._save_repos()
+    
+    def _delete_repo_row(self, repo_id: str):
+        """从数据库删除仓库配置"""
+        try:
+            with get_db_session() as db:
+                db.query(PollingRepoRow).filter(PollingRepoRow.id == repo_id).delete()
+        except Exception as e:
+            logger.error(f"删除仓库配置失败 {repo_id}: {e}")
     
     def add_repo(self, repo: PollingRepo, verify: bool = False) -> bool:
         """
@@ -143,7 +363,11 @@ class PollingManager:
 
         with self._repos_lock:
             self._repos[repo.id] = repo
-        self._save_repos()
+            if repo.enabled:
+                self._enabled_ids.add(repo.id)
+            self._publish_view()
+        self._save_repo(repo)
+        self.wakeup()
         logger.info(f"添加轮询仓库: {repo.name} ({repo.url})")
         return True
 
@@ -155,27 +379,11 @@ class PollingManager:
         import subprocess
         
         try:
-            settings = SettingsManager.get_all()
-            git_server_url = settings.get('git_server_url', '')
-            
-            auth_url = repo.url
-            if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    http_user=repo.http_user,
-                    http_password=repo.http_password,
-                    server_url=git_server_url
-                )
-            elif repo.auth_type == 'token' and repo.token:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    token=repo.token,
-                    server_url=git_server_url
-                )
+            auth_url = self._get_auth_url(repo)
             
             # 使用 git ls-remote 验证连接
-            cmd = ['git', 'ls-remote', '-h', auth_url, 'HEAD']
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+            cmd = ['git', *_GIT_NET_ARGS, 'ls-remote', '-h', auth_url, 'HEAD']
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=15, env=_GIT_ENV)
             
             if result.returncode == 0:
                 return True, ""
@@ -192,59 +400,98 @@ class PollingManager:
         with self._repos_lock:
             if repo_id in self._repos:
                 repo = self._repos.pop(repo_id)
-                self._save_repos()
-                logger.info(f"删除轮询仓库: {repo.name}")
-                return True
-        return False
+                self._enabled_ids.discard(repo_id)
+                self._etags.pop(f"{repo_id}:mrs", None)
+                self._auth_urls.pop(repo_id, None)
+                self._dirty_ids.discard(repo_id)
+                self._publish_view()
+            else:
+                return False
+        # 写库不持有 _repos_lock，避免 SQLite 忙等待时阻塞轮询线程和合并写入线程
+        self._delete_repo_row(repo_id)
+        logger.info(f"删除轮询仓库: {repo.name}")
+        return True
     
     def update_repo(self, repo_id: str, updates: dict) -> bool:
-        """更新仓库配置"""
+        """
+        更新仓库配置：以新对象整体替换旧对象（写时复制），读取方不会看到更新到一半的仓库，
+        进行中的检查持有的旧对象随之失效，其结果不再写回
+        """
+        # 只接受配置字段，运行时状态（_last_poll_ts、_interval_seconds、_backoff）不允许从外部写入
+        changes = {k: v for k, v in updates.items() if k in _POLLING_REPO_INIT_FIELDS}
         with self._repos_lock:
             if repo_id in self._repos:
-                repo = self._repos[repo_id]
-                for key, value in updates.items():
-                    if hasattr(repo, key):
-                        setattr(repo, key, value)
-                self._save_repos()
-                return True
-        return False
+                old = self._repos[repo_id]
+                # 轮询间隔与退避倍数按新配置重新计算，保留上次轮询时间
+                repo = replace(old, **changes)
+                repo._last_poll_ts = old._last_poll_ts
+                self._repos[repo_id] = repo
+                if repo.enabled:
+                    self._enabled_ids.add(repo_id)
+                else:
+                    self._enabled_ids.discard(repo_id)
+                self._publish_view()
+                # 配置变化（如分支、last_mr_id 重置）后需要重新解析远端 refs
+                self._etags.pop(f"{repo_id}:mrs", None)
+                self._auth_urls.pop(repo_id, None)
+            else:
+                return False
+        self._save_repo(repo)
+        self.wakeup()
+        return True
     
     def get_repos(self) -> List[dict]:
         """获取所有仓库"""
-        with self._repos_lock:
-            return [r.to_dict() for r in self._repos.values()]
+        return [r.to_dict() for r in self._repos_view.values()]
+    
+    def get_repo_objs(self) -> Tuple[PollingRepo, ...]:
+        """获取所有仓库对象的快照（只读视图，无需加锁）"""
+        return tuple(self._repos_view.values())
     
     def get_repo(self, repo_id: str) -> Optional[dict]:
         """获取单个仓库（字典格式）"""
-        with self._repos_lock:
-            if repo_id in self._repos:
-                return self._repos[repo_id].to_dict()
-        return None
+        repo = self._repos_view.get(repo_id)
+        return repo.to_dict() if repo else None
     
     def get_repo_obj(self, repo_id: str) -> Optional[PollingRepo]:
         """获取单个仓库对象"""
-        with self._repos_lock:
-            return self._repos.get(repo_id)
+        return self._repos_view.get(repo_id)
     
     @property
     def is_running(self) -> bool:
         return self._running
     
+    def wakeup(self):
+        """唤醒轮询线程立即扫描到期仓库，无需等待下一个扫描周期"""
+        self._wakeup.set()
+    
     def start(self):
         """启动轮询（作为守护线程）"""
         if self._thread and self._thread.is_alive():
             return
         
+        self.load()
         self._running = True
+        self._stop_event.clear()
         self._thread = threading.Thread(target=self._polling_loop, daemon=True)
         self._thread.start()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="poll-flush")
+        self._flusher.start()
         logger.info("轮询服务已启动（后台守护模式）")
 
     def stop(self):
         """停止轮询服务"""
         self._running = False
+        self._stop_event.set()
+        self._wakeup.set()
+        self._flush_event.set()
         if self._thread:
             self._thread.join(timeout=1)
+        if self._flusher:
+            self._flusher.join(timeout=1)
+        # 最后一次落库，确保合并窗口内的变更不丢失
+        if self._dirty_ids:
+            self._save_repos()
         logger.info("轮询服务已停止")
     
     
@@ -252,237 +499,304 @@ class PollingManager:
         """轮询主循环"""
         while self._running:
             try:
-                # 获取全量仓库列表快照
-                with self._repos_lock:
-                    repos_snapshot = list(self._repos.values())
+                # 先复位唤醒标记再读取仓库列表：此后到来的 wakeup() 会让下一次等待立即返回，不会丢失
+                self._wakeup.clear()
+                if self._stop_event.is_set():
+                    break
+                
+                # 已启用仓库的只读视图，仓库对象原地修改，无需加锁复制
+                repos_snapshot = self._enabled_view
                 
                 now = time.time()
                 
-                # 检查所有启用的仓库
-                for repo in repos_snapshot:
-                    if not self._running:
-                        break
-                    
-                    if not repo.enabled or repo.trigger_mode not in ['polling', 'both']:
-                        continue
-                    
-                    # 检查是否到了该仓库的轮询时间
-                    interval_seconds = repo.polling_interval * 60
-                    last_poll = self._last_poll_times.get(repo.id, 0)
-                    
-                    if now - last_poll >= interval_seconds:
-                        try:
-                            logger.info(f"开始轮询仓库: {repo.name} (间隔: {repo.polling_interval}分)")
-                            self._check_repo(repo)
-                            self._last_poll_times[repo.id] = now
-                        except Exception as e:
-                            logger.error(f"检查仓库 {repo.name} 失败: {e}", exc_info=True)
+                # 筛选到了轮询时间的仓库（上一轮的线程池任务已全部结束，此处读取无需加锁）
+                due_repos = [
+                    repo for repo in repos_snapshot
+                    if repo.trigger_mode in ('polling', 'both')
+                    and now - repo._last_poll_ts >= repo._interval_seconds * repo._backoff
+                ]
+                
+                # 并发检查到期仓库，等待本轮全部完成
+                if due_repos and self._running:
+                    wave_ts = datetime.utcnow().isoformat()  # 本轮统一的检查时间
+                    list(self._pool.map(lambda r: self._check_repo_safe(r, now, wave_ts), due_repos))
                 
-                # 短暂休眠，避免空转消耗CPU
-                for _ in range(10):  # 每10秒扫描一次任务列表
-                    if not self._running:
-                        break
-                    time.sleep(1)
+                # 每10秒扫描一次任务列表，仓库变化或 stop() 时立即唤醒
+                self._wakeup.wait(timeout=10)
                     
             except Exception as e:
                 logger.error(f"轮询循环异常: {e}", exc_info=True)
-                time.sleep(10)
+                if self._stop_event.wait(timeout=10):
+                    break
+    
+    def _check_repo_safe(self, repo: PollingRepo, now: float, wave_ts: Optional[str] = None):
+        """在线程池中检查单个仓库，异常只记录日志不向外抛出；每次检查在此处记录一次成功或失败"""
+        if not self._running:
+            return
+        # 快照之后仓库可能已被删除或替换，跳过过期对象
+        if self._repos_view.get(repo.id) is not repo:
+            return
+        try:
+            logger.info(f"开始轮询仓库: {repo.name} (间隔: {repo.polling_interval}分)")
+            ok = self._check_repo(repo, wave_ts)
+        except Exception as e:
+            logger.error(f"检查仓库 {repo.name} 失败: {e}", exc_info=True)
+            ok = False
+        with self._repos_lock:
+            # 检查期间仓库被更新或删除，丢弃本次结果，保留 update_repo 的重置
+            if not self._is_current(repo):
+                return
+            repo._last_poll_ts = now
+            # 远端访问失败时退避，成功后恢复正常间隔
+            if ok:
+                repo._backoff = 1
+            else:
+                self._record_failure(repo)
     
-    def _check_repo(self, repo: PollingRepo):
-        """检查单个仓库的新提交/MR（使用git命令，不依赖API）"""
+    def _record_failure(self, repo: PollingRepo):
+        """记录一次检查失败：轮询间隔指数退避，避免持续请求不可用的远端"""
+        repo._backoff = min(repo._backoff * 2, self._MAX_BACKOFF)
+        logger.warning(f"仓库 {repo.name} 检查失败，下次轮询间隔放大为 {repo._backoff} 倍")
+    
+    def _check_repo(self, repo: PollingRepo, wave_ts: Optional[str] = None) -> bool:
+        """检查单个仓库的新提交/MR（使用git命令，不依赖API），远端访问失败返回 False"""
+        
+        # 本轮检查使用同一份配置快照，传递给后续的 ls-remote 和审查触发
+        settings = self._get_settings()
         
         # 解析生效时间
-        effective_time = None
-        if repo.effective_time:
-            try:
-                effective_time = datetime.fromisoformat(repo.effective_time.replace('Z', '+00:00'))
-            except ValueError:
-                logger.warning(f"无效的生效时间格式: {repo.effective_time}")
+        effective_time = _parse_effective_time(repo.effective_time) if repo.effective_time else None
+        
+        # 一次 git ls-remote 同时获取远程分支HEAD与MR refs
+        refs = None
+        if repo.poll_commits or repo.poll_mrs:
+            refs = self._ls_remote_all(repo, settings, commits=repo.poll_commits, mrs=repo.poll_mrs)
         
-        # 检查新提交 - 使用git ls-remote获取远程HEAD
-        if repo.poll_commits:
-            new_commits = self._get_new_commits_git(repo, effective_time)
+        # 检查新提交
+        if repo.poll_commits and refs is not None:
+            new_commits = self._get_new_commits_git(repo, effective_time, settings, refs)
             if new_commits:
                 # 首次轮询（last_commit_id为空）只记录最新commit，不触发审查
                 if not repo.last_commit_id:
                     logger.info(f"仓库 {repo.name} 首次轮询，记录最新commit: {new_commits[0]['id'][:8]}")
-                    repo.last_commit_id = new_commits[0]['id']
+                    self._apply_state(repo, last_commit_id=new_commits[0]['id'])
                 else:
                     logger.info(f"仓库 {repo.name} 发现 {len(new_commits)} 个新提交")
                     for commit in new_commits:
-                        self._trigger_review(repo, 'commit', commit)
+                        self._trigger_review(repo, 'commit', commit, settings)
                     # 更新最后检查的commit
-                    repo.last_commit_id = new_commits[0]['id']
+                    self._apply_state(repo, last_commit_id=new_commits[0]['id'])
         
-        # 检查新MR - 使用git ls-remote检查MR refs
-        if repo.poll_mrs:
-            new_mrs = self._get_new_mrs_git(repo, effective_time)
+        # 检查新MR
+        if repo.poll_mrs and refs is not None:
+            new_mrs = self._get_new_mrs_git(repo, effective_time, settings, refs)
             if new_mrs:
+                # new_mrs 已按ID降序排列，首项即最大ID
+                max_mr_id = new_mrs[0]['iid']
                 # 首次轮询（last_mr_id为0）只记录最新MR ID，不触发审查
                 if repo.last_mr_id == 0:
-                    max_mr_id = max(mr['iid'] for mr in new_mrs)
                     logger.info(f"仓库 {repo.name} 首次轮询，记录最新MR ID: {max_mr_id}")
-                    repo.last_mr_id = max_mr_id
+                    self._apply_state(repo, last_mr_id=max_mr_id)
                 else:
                     logger.info(f"仓库 {repo.name} 发现 {len(new_mrs)} 个新MR")
                     for mr in new_mrs:
-                        self._trigger_review(repo, 'merge_request', mr)
+                        self._trigger_review(repo, 'merge_request', mr, settings)
                     # 更新最后检查的MR
-                    repo.last_mr_id = max(mr['iid'] for mr in new_mrs)
+                    self._apply_state(repo, last_mr_id=max_mr_id)
+        
+        # 更新检查时间（由合并写入线程统一保存）
+        self._apply_state(repo, last_check_time=wave_ts or datetime.utcnow().isoformat())
+        self._mark_dirty(repo.id)
+        return refs is not None or not (repo.poll_commits or repo.poll_mrs)
+    
+    def _is_current(self, repo: PollingRepo) -> bool:
+        """仓库对象是否仍是当前配置（update_repo 替换或 remove_repo 删除后旧对象失效），调用方需持有 _repos_lock"""
+        return self._repos.get(repo.id) is repo
+    
+    def _apply_state(self, repo: PollingRepo, **state):
+        """在锁内更新仓库的轮询状态字段；对象已被替换或删除时丢弃，避免过期的检查覆盖新配置"""
+        with self._repos_lock:
+            if not self._is_current(repo):
+                return
+            for key, value in state.items():
+                setattr(repo, key, value)
+    
+    def _set_clone_status(self, repo_id: str, status: str):
+        """更新当前仓库对象的克隆状态（克隆期间仓库配置可能已被替换）"""
+        with self._repos_lock:
+            current = self._repos.get(repo_id)
+            if current is not None:
+                current.clone_status = status
+        self._mark_dirty(repo_id)
+    
+    @staticmethod
+    def _mr_ref_pattern(platform: str) -> str:
+        """根据平台选择MR refs模式"""
+        return _PLATFORM_MR_REFS.get(platform, _DEFAULT_MR_REFS)
+    
+    def _get_settings(self) -> Dict[str, str]:
+        """
+        获取全局配置快照（只读，调用方不要修改返回的字典）
+        仅在配置版本号变化时重新加载；兼顾进程外直接修改数据库的情况，最长缓存60秒
+        """
+        version = SettingsManager.get_version()
+        now = time.monotonic()
+        if version != self._settings_version or now - self._settings_time >= 60:
+            self._settings_snapshot = SettingsManager.get_all()
+            self._settings_version = version
+            self._settings_time = now
+        return self._settings_snapshot
+    
+    def _get_auth_url(self, repo: PollingRepo, settings: Optional[dict] = None) -> str:
+        """获取带认证信息的仓库URL（按认证相关字段缓存，字段变化时自动重新生成）"""
+        if settings is None:
+            settings = self._get_settings()
+        git_server_url = settings.get('git_server_url', '')
         
-        # 更新检查时间
-        repo.last_check_time = datetime.utcnow().isoformat()
-        self._save_repos()
+        key = (repo.url, repo.auth_type, repo.http_user, repo.http_password, repo.token, git_server_url)
+        cached = self._auth_urls.get(repo.id)
+        if cached and cached[0] == key:
+            return cached[1]
+        
+        auth_url = repo.url
+        if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
+            auth_url = convert_to_http_auth_url(
+                repo.url,
+                http_user=repo.http_user,
+                http_password=repo.http_password,
+                server_url=git_server_url
+            )
+        elif repo.auth_type == 'token' and repo.token:
+            auth_url = convert_to_http_auth_url(
+                repo.url,
+                token=repo.token,
+                server_url=git_server_url
+            )
+        self._auth_urls[repo.id] = (key, auth_url)
+        return auth_url
     
-    def _get_new_commits_git(self, repo: PollingRepo, effective_time: Optional[datetime] = None) -> List[dict]:
-        """使用git命令获取新提交（不依赖API）"""
+    def _ls_remote_all(self, repo: PollingRepo, settings: Optional[dict] = None,
+                       commits: bool = True, mrs: bool = True) -> Optional[dict]:
+        """
+        一次 git ls-remote 同时获取分支HEAD和MR refs，避免每个仓库多次建立连接
+        :return: {'branch_sha': 分支最新SHA或None, 'mr_text': ls-remote原始输出(bytes)}，失败返回None
+        """
         import subprocess
         
+        branch_ref = f'refs/heads/{repo.branch}'
+        patterns = []
+        if commits:
+            patterns.append(branch_ref)
+        if mrs:
+            patterns.append(self._mr_ref_pattern(repo.platform))
+        if not patterns:
+            return {'branch_sha': None, 'mr_text': b''}
+        
         try:
-            # 构建认证URL
-            settings = SettingsManager.get_all()
-            git_server_url = settings.get('git_server_url', '')
-            
-            auth_url = repo.url
-            if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    http_user=repo.http_user,
-                    http_password=repo.http_password,
-                    server_url=git_server_url
-                )
-            elif repo.auth_type == 'token' and repo.token:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    token=repo.token,
-                    server_url=git_server_url
-                )
-            
-            # 使用git ls-remote获取远程分支的最新commit SHA
-            cmd = ['git', 'ls-remote', auth_url, f'refs/heads/{repo.branch}']
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                logger.error(f"git ls-remote失败: {result.stderr}")
-                return []
-            
-            # 解析输出: <sha>\trefs/heads/<branch>
-            output = result.stdout.strip()
-            if not output:
-                logger.warning(f"仓库 {repo.name} 分支 {repo.branch} 未找到")
-                return []
-            
-            remote_sha = output.split('\t')[0]
-            
-            # 如果和上次相同，没有新提交
-            if remote_sha == repo.last_commit_id:
-                return []
-            
-            # 发现新提交
-            return [{
-                'id': remote_sha,
-                'message': f'New commit on {repo.branch}',
-                'author': 'Polling',
-            }]
-            
+            cmd = ['git', *_GIT_NET_ARGS, 'ls-remote', self._get_auth_url(repo, settings), *patterns]
+            result = subprocess.run(cmd, capture_output=True, timeout=30, env=_GIT_ENV)
         except subprocess.TimeoutExpired:
             logger.error(f"git ls-remote超时: {repo.name}")
-            return []
+            return None
         except Exception as e:
-            logger.error(f"获取提交失败: {e}")
-            return []
-    
-    def _get_new_mrs_git(self, repo: PollingRepo, effective_time: Optional[datetime] = None) -> List[dict]:
-        """使用git命令获取新MR（通过检查refs/merge-requests或refs/pull）"""
-        import subprocess
+            logger.error(f"git ls-remote执行失败: {e}")
+            return None
         
-        try:
-            # 构建认证URL
-            settings = SettingsManager.get_all()
-            git_server_url = settings.get('git_server_url', '')
-            
-            auth_url = repo.url
-            if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    http_user=repo.http_user,
-                    http_password=repo.http_password,
-                    server_url=git_server_url
-                )
-            elif repo.auth_type == 'token' and repo.token:
-                auth_url = convert_to_http_auth_url(
-                    repo.url,
-                    token=repo.token,
-                    server_url=git_server_url
-                )
-            
-            # 根据平台选择MR refs模式
-            platform = repo.platform
-            if platform == 'gitlab':
-                # GitLab: refs/merge-requests/<id>/head
-                ref_pattern = 'refs/merge-requests/*/head'
-            else:
-                # GitHub/Gitea: refs/pull/<id>/head
-                ref_pattern = 'refs/pull/*/head'
-            
-            # 使用git ls-remote获取所有MR refs
-            cmd = ['git', 'ls-remote', auth_url, ref_pattern]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode != 0:
-                # 有些仓库可能不支持这种refs模式，静默处理
-                logger.debug(f"git ls-remote MR失败: {result.stderr}")
+        if result.returncode != 0:
+            logger.error(f"git ls-remote失败: {result.stderr.decode(errors='replace')}")
+            return None
+        
+        # 输出格式: <sha>\t<ref>；只按字节查找分支行，MR行留给 _MR_REF_RE 一次扫描
+        stdout = result.stdout
+        branch_sha = None
+        if commits:
+            match = re.search(rb'^([0-9a-f]+)\t' + re.escape(branch_ref.encode()) + rb'$\n?', stdout, re.M)
+            if match:
+                branch_sha = match.group(1).decode()
+                # 去掉分支行，使MR部分的摘要不受分支提交影响
+                stdout = stdout[:match.start()] + stdout[match.end():]
+        
+        return {'branch_sha': branch_sha, 'mr_text': stdout if mrs else b''}
+    
+    def _get_new_commits_git(self, repo: PollingRepo, effective_time: Optional[datetime] = None,
+                             settings: Optional[dict] = None, refs: Optional[dict] = None) -> List[dict]:
+        """使用git命令获取新提交（不依赖API），refs 为 _ls_remote_all 的结果，未传入时单独查询"""
+        if refs is None:
+            refs = self._ls_remote_all(repo, settings, commits=True, mrs=False)
+            if refs is None:
                 return []
-            
-            # 解析输出获取MR ID
-            new_mrs = []
-            for line in result.stdout.strip().split('\n'):
-                if not line or '\t' not in line:
-                    continue
-                    
-                sha, ref = line.split('\t')
-                
-                # 提取MR ID
-                if platform == 'gitlab':
-                    # refs/merge-requests/123/head -> 123
-                    parts = ref.split('/')
-                    if len(parts) >= 3:
-                        try:
-                            mr_id = int(parts[2])
-                        except ValueError:
-                            continue
-                else:
-                    # refs/pull/123/head -> 123
-                    parts = ref.split('/')
-                    if len(parts) >= 3:
-                        try:
-                            mr_id = int(parts[2])
-                        except ValueError:
-                            continue
-                
-                # 检查是否是新MR
-                if mr_id > repo.last_mr_id:
-                    new_mrs.append({
-                        'iid': mr_id,
-                        'title': f'MR #{mr_id}',
-                        'source_branch': f'mr-{mr_id}',
-                        'target_branch': repo.branch,
-                        'source_ref': ref,  # 如 refs/merge-requests/123/head
-                    })
-            
-            # 按ID排序（最新的在前）
-            new_mrs.sort(key=lambda x: x['iid'], reverse=True)
-            return new_mrs
-            
-        except subprocess.TimeoutExpired:
-            logger.error(f"git ls-remote MR超时: {repo.name}")
+        
+        remote_sha = refs['branch_sha']
+        if not remote_sha:
+            logger.warning(f"仓库 {repo.name} 分支 {repo.branch} 未找到")
             return []
-        except Exception as e:
-            logger.error(f"获取MR失败: {e}")
+        
+        # 如果和上次相同，没有新提交
+        if remote_sha == repo.last_commit_id:
             return []
+        
+        # 发现新提交
+        return [{
+            'id': remote_sha,
+            'message': f'New commit on {repo.branch}',
+            'author': 'Polling',
+        }]
+    
+    def _get_new_mrs_git(self, repo: PollingRepo, effective_time: Optional[datetime] = None,
+                         settings: Optional[dict] = None, refs: Optional[dict] = None) -> List[dict]:
+        """
+        使用git命令获取新MR（通过检查refs/merge-requests或refs/pull），refs 含义同上
+        返回按ID降序排列的新MR；首次轮询（last_mr_id为0）只返回ID最大的一个
+        """
+        if refs is None:
+            refs = self._ls_remote_all(repo, settings, commits=False, mrs=True)
+            if refs is None:
+                return []
+        
+        mr_text = refs['mr_text']
+        
+        # MR refs 与上次完全相同，不可能有新MR，跳过解析
+        etag_key = f"{repo.id}:mrs"
+        mr_etag = hashlib.sha256(mr_text).digest()
+        if self._etags.get(etag_key) == mr_etag:
+            return []
+        
+        # 解析MR ID: refs/merge-requests/123/head 或 refs/pull/123/head -> 123
+        last_mr_id = repo.last_mr_id
+        found = []
+        max_found = None
+        for match in _MR_REF_RE.finditer(mr_text):
+            mr_id = int(match.group(2))
+            if mr_id <= last_mr_id:
+                continue
+            item = (mr_id, match.group(1).decode())
+            found.append(item)
+            if max_found is None or mr_id > max_found[0]:
+                max_found = item
+        
+        if last_mr_id == 0:
+            # 首次轮询只需记录最大ID，不必为全部历史MR构建和排序列表
+            found = [max_found] if max_found else []
+        else:
+            # 按ID排序（最新的在前）
+            found.sort(reverse=True)
+        
+        new_mrs = [{
+            'iid': mr_id,
+            'title': f'MR #{mr_id}',
+            'source_branch': f'mr-{mr_id}',
+            'target_branch': repo.branch,
+            'source_ref': ref,  # 如 refs/merge-requests/123/head
+        } for mr_id, ref in found]
+        with self._repos_lock:
+            # 检查期间配置已变化时不写回摘要，下次按新配置重新解析
+            if self._is_current(repo):
+                self._etags[etag_key] = mr_etag
+        return new_mrs
     
     
-    def _trigger_review(self, repo: PollingRepo, strategy: str, item: dict):
+    def _trigger_review(self, repo: PollingRepo, strategy: str, item: dict,
+                        settings: Optional[dict] = None):
         """触发代码审查"""
         if not self._review_callback:
             logger.warning("未设置审查回调函数")
@@ -498,23 +812,7 @@ class PollingManager:
         repo_name_parsed = path_parts[-1] if path_parts else repo.name
         
         # 使用仓库级别的认证信息，转换为认证URL用于克隆
-        settings = SettingsManager.get_all()
-        git_server_url = settings.get('git_server_url', '')
-        
-        clone_url = repo.url
-        if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
-            clone_url = convert_to_http_auth_url(
-                repo.url,
-                http_user=repo.http_user,
-                http_password=repo.http_password,
-                server_url=git_server_url
-            )
-        elif repo.auth_type == 'token' and repo.token:
-            clone_url = convert_to_http_auth_url(
-                repo.url,
-                token=repo.token,
-                server_url=git_server_url
-            )
+        clone_url = self._get_auth_url(repo, settings)
         
         # 如果是纯轮询方式，不支持评论回写 (Requirement 3)
         enable_comment = repo.enable_comment
@@ -563,8 +861,8 @@ class PollingManager:
     def get_status(self) -> dict:
         """获取轮询状态"""
         return {
-            "repos_count": len(self._repos),
-            "enabled_repos": sum(1 for r in self._repos.values() if r.enabled),
+            "repos_count": len(self._repos_view),
+            "enabled_repos": len(self._enabled_view),
         }
     
     def clone_repo(self, repo: PollingRepo) -> dict:
@@ -575,22 +873,11 @@ class PollingManager:
         local_path = repo.get_local_path()
         
         # 构建克隆URL
-        settings = SettingsManager.get_all()
-        git_server_url = settings.get('git_server_url', '')
-        
-        clone_url = repo.url
-        if repo.auth_type == 'http_basic' and repo.http_user and repo.http_password:
-            clone_url = convert_to_http_auth_url(
-                repo.url,
-                repo.http_user,
-                repo.http_password,
-                git_server_url
-            )
+        clone_url = self._get_auth_url(repo)
         
         try:
             # 更新状态
-            repo.clone_status = 'cloning'
-            self._save_repos()
+            self._set_clone_status(repo.id, 'cloning')
             
             # 如果目录已存在，先删除
             if os.path.exists(local_path):
@@ -605,23 +892,19 @@ class PollingManager:
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
             
             if result.returncode == 0:
-                repo.clone_status = 'cloned'
-                self._save_repos()
+                self._set_clone_status(repo.id, 'cloned')
                 logger.info(f"仓库 {repo.name} 克隆成功: {local_path}")
                 return {"success": True, "message": f"克隆成功: {local_path}", "path": local_path}
             else:
-                repo.clone_status = 'error'
-                self._save_repos()
+                self._set_clone_status(repo.id, 'error')
                 logger.error(f"仓库 {repo.name} 克隆失败: {result.stderr}")
                 return {"success": False, "message": f"克隆失败: {result.stderr[:200]}"}
                 
         except subprocess.TimeoutExpired:
-            repo.clone_status = 'error'
-            self._save_repos()
+            self._set_clone_status(repo.id, 'error')
             return {"success": False, "message": "克隆超时"}
         except Exception as e:
-            repo.clone_status = 'error'
-            self._save_repos()
+            self._set_clone_status(repo.id, 'error')
             logger.error(f"克隆仓库失败: {e}")
             return {"success": False, "message": str(e)}
     
@@ -633,7 +916,7 @@ class PollingManager:
         
         try:
             # 构建认证URL
-            settings = SettingsManager.get_all()
+            settings = self._get_settings()
             git_server_url = settings.get('git_server_url', '')
             
             auth_url = repo_url
@@ -652,12 +935,13 @@ class PollingManager:
                 )
             
             # 执行git ls-remote获取分支
-            cmd = ['git', 'ls-remote', '--heads', auth_url]
+            cmd = ['git', *_GIT_NET_ARGS, 'ls-remote', '--heads', auth_url]
             result = subprocess.run(
                 cmd,
                 capture_output=True,
                 text=True,
-                timeout=30
+                timeout=30,
+                env=_GIT_ENV
             )
             
             if result.returncode != 0:
@@ -684,5 +968,5 @@ class PollingManager:
             return []
 
 
-# 全局实例
+# 全局实例（由服务 lifespan 启动和停止）
 polling_manager = PollingManager()
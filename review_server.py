@@ -6,12 +6,14 @@ Aider Code Review 服务入口
 - services/: 业务逻辑服务
 """
 import os
+import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from collections import defaultdict
+from typing import Dict
 
 from config import config
 from database import init_database
@@ -19,16 +21,36 @@ from settings import SettingsManager
 from utils import logger
 from polling import polling_manager
 
+# ==================== 生命周期 ====================
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务启动时初始化数据库和默认配置并启动轮询，停止时清理；导入模块本身不再访问数据库"""
+    from services import git_comment, review_queue
+    
+    init_database()
+    SettingsManager.init_defaults()
+    polling_manager.load()
+    # 轮询发现的审查任务提交到审查线程池，不阻塞轮询线程；先注册回调再启动轮询
+    polling_manager.set_review_callback(review_queue.submit_review)
+    polling_manager.start()
+    logger.info("轮询审查回调已注册")
+    
+    yield
+    
+    polling_manager.stop()
+    review_queue.shutdown(wait=False)
+    git_comment.close()
+
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="Aider Code Review Service",
     description="基于Aider的自动化代码审查中间件",
-    version=config.version
+    version=config.version,
+    lifespan=lifespan
 )
 
-# 初始化数据库
-init_database()
-
 # ==================== 中间件 ====================
 
 # CORS中间件
@@ -40,30 +62,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 简单的请求速率限制
-request_counts = defaultdict(lambda: {"count": 0, "reset_time": 0})
+# 简单的请求速率限制（固定窗口）：客户端 IP -> [本窗口请求数, 窗口结束时刻]
+# 中间件只在事件循环线程中执行，无需加锁；过期条目每个窗口清理一次，内存不随历史 IP 增长
+request_counts: Dict[str, list] = {}
 RATE_LIMIT = 100
 RATE_WINDOW = 60
+# 健康检查与静态资源不计数，避免负载均衡探测占满名额
+_RATE_EXEMPT_PATHS = frozenset({"/health"})
+_RATE_EXEMPT_PREFIX = "/static/"
+_next_sweep = 0.0
 
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     """简单的速率限制中间件"""
-    import time
+    global _next_sweep
+    path = request.url.path
+    if path in _RATE_EXEMPT_PATHS or path.startswith(_RATE_EXEMPT_PREFIX):
+        return await call_next(request)
+    
     client_ip = request.client.host if request.client else "unknown"
-    current_time = time.time()
+    now = time.monotonic()
     
-    rate_info = request_counts[client_ip]
-    if current_time > rate_info["reset_time"]:
-        rate_info["count"] = 0
-        rate_info["reset_time"] = current_time + RATE_WINDOW
+    if now >= _next_sweep:
+        for ip in [ip for ip, info in request_counts.items() if info[1] <= now]:
+            del request_counts[ip]
+        _next_sweep = now + RATE_WINDOW
     
-    rate_info["count"] += 1
+    rate_info = request_counts.get(client_ip)
+    if rate_info is None or now > rate_info[1]:
+        rate_info = request_counts[client_ip] = [0, now + RATE_WINDOW]
+    rate_info[0] += 1
     
-    if rate_info["count"] > RATE_LIMIT:
+    if rate_info[0] > RATE_LIMIT:
         return JSONResponse(
             status_code=429,
-            content={"detail": "请求过于频繁，请稍后再试"}
+            content={"detail": "请求过于频繁，请稍后再试"},
+            headers={"Retry-After": str(max(1, int(rate_info[1] - now)))}
         )
     
     return await call_next(request)
@@ -85,14 +120,18 @@ STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 if os.path.exists(STATIC_DIR):
     app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# 首页路径与回退响应在启动时确定，请求时不再拼接路径和 stat
+_INDEX_PATH = os.path.join(STATIC_DIR, 'index.html')
+_INDEX_EXISTS = os.path.isfile(_INDEX_PATH)
+_INDEX_FALLBACK = {"message": "Aider Code Review Service", "version": config.version}
+
 
 @app.get("/")
 async def index():
     """返回仪表盘首页"""
-    index_path = os.path.join(STATIC_DIR, 'index.html')
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
-    return {"message": "Aider Code Review Service", "version": config.version}
+    if _INDEX_EXISTS:
+        return FileResponse(_INDEX_PATH)
+    return _INDEX_FALLBACK
 
 
 # ==================== 注册路由 ====================
@@ -110,17 +149,6 @@ app.include_router(testing_router)
 app.include_router(polling_router)
 
 
-# ==================== 启动事件 ====================
-
-@app.on_event("startup")
-async def startup_event():
-    """服务启动时初始化"""
-    # 导入核心审查函数并设置回调
-    from services.review import run_aider_review
-    polling_manager.set_review_callback(run_aider_review)
-    logger.info("轮询审查回调已注册")
-
-
 # ==================== 启动入口 ====================
 
 if __name__ == "__main__":
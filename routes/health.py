@@ -2,19 +2,29 @@
 健康检查路由
 """
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 from config import config
 from settings import SettingsManager
 
 router = APIRouter(tags=["Health"])
 
+# 存活探针高频调用，返回预先构造的静态响应，不读配置、不做 JSON 序列化
+_HEALTH_OK = PlainTextResponse("OK")
 
-@router.get("/health")
+
+@router.get("/health", response_class=PlainTextResponse)
 async def health_check():
-    """健康检查接口"""
-    settings = SettingsManager.get_all()
+    """健康检查接口（存活探针）"""
+    return _HEALTH_OK
+
+
+@router.get("/health/detail")
+async def health_detail():
+    """健康检查详情：版本与当前配置的模型端点、Git 平台"""
+    # 直接读取配置缓存，缓存有效期内不访问数据库
     return {
         "status": "healthy",
         "version": config.version,
-        "vllm_endpoint": settings.get('vllm_api_base', config.vllm.api_base),
-        "git_platform": settings.get('git_platform', config.git.platform)
+        "vllm_endpoint": SettingsManager.get('vllm_api_base', config.vllm.api_base),
+        "git_platform": SettingsManager.get('git_platform', config.git.platform)
     }
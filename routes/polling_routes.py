@@ -1,22 +1,22 @@
 """
 轮询管理 API 路由
 """
-import re
 import uuid
+from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, Request, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Body, HTTPException, BackgroundTasks
 
 from polling import polling_manager, PollingRepo
+from services import review_queue
+from services.review_queue import QueueFullError, submit_review
 from settings import SettingsManager
 from utils import convert_to_http_auth_url, extract_project_path
 
-# 导入核心审查函数 (延迟导入避免循环依赖)
-def get_run_aider_review():
-    from services.review import run_aider_review
-    return run_aider_review
-
 router = APIRouter(prefix="/api/polling", tags=["Polling"])
 
+# 请求体声明为 Body 参数，由 FastAPI 在事件循环中读取解析；
+# 包含 git 子进程、网络请求或数据库写入的接口声明为普通 def 由线程池执行，不阻塞事件循环
+
 
 @router.get("/status")
 async def get_polling_status():
@@ -24,6 +24,12 @@ async def get_polling_status():
     return polling_manager.get_status()
 
 
+@router.get("/queue")
+def get_review_queue():
+    """获取审查队列状态"""
+    return review_queue.get_stats()
+
+
 @router.get("/repos")
 async def get_polling_repos():
     """获取轮询仓库列表"""
@@ -31,10 +37,8 @@ async def get_polling_repos():
 
 
 @router.post("/repos")
-async def add_polling_repo(request: Request):
+def add_polling_repo(data: Dict[str, Any] = Body(...)):
     """添加轮询仓库"""
-    data = await request.json()
-    
     # 生成唯一ID
     repo_id = str(uuid.uuid4())[:8]
     
@@ -70,9 +74,8 @@ async def add_polling_repo(request: Request):
 
 
 @router.post("/repos/test")
-async def test_repo_connectivity(request: Request):
+def test_repo_connectivity(data: Dict[str, Any] = Body(...)):
     """测试仓库连通性（保存前校验）"""
-    data = await request.json()
     repo = PollingRepo(
         id=data.get('id', str(uuid.uuid4())[:8]),
         name=data.get('name', 'test'),
@@ -92,13 +95,10 @@ async def test_repo_connectivity(request: Request):
 
 
 @router.post("/repos/verify-all")
-async def verify_all_repos():
+def verify_all_repos():
     """批量校验所有已添加仓库的连通性"""
     results = {}
-    with polling_manager._repos_lock:
-        repos = list(polling_manager._repos.values())
-    
-    for repo in repos:
+    for repo in polling_manager.get_repo_objs():
         success, error = polling_manager.test_connectivity(repo)
         results[repo.id] = {
             "name": repo.name,
@@ -110,10 +110,8 @@ async def verify_all_repos():
 
 
 @router.put("/repos/{repo_id}")
-async def update_polling_repo(repo_id: str, request: Request):
+def update_polling_repo(repo_id: str, data: Dict[str, Any] = Body(...)):
     """更新轮询仓库"""
-    data = await request.json()
-    
     success = polling_manager.update_repo(repo_id, data)
     if success:
         return {"status": "updated", "repo": polling_manager.get_repo(repo_id)}
@@ -122,7 +120,7 @@ async def update_polling_repo(repo_id: str, request: Request):
 
 
 @router.delete("/repos/{repo_id}")
-async def delete_polling_repo(repo_id: str):
+def delete_polling_repo(repo_id: str):
     """删除轮询仓库"""
     success = polling_manager.remove_repo(repo_id)
     if success:
@@ -132,10 +130,8 @@ async def delete_polling_repo(repo_id: str):
 
 
 @router.post("/branches")
-async def get_repo_branches(request: Request):
+def get_repo_branches(data: Dict[str, Any] = Body(...)):
     """获取仓库分支列表"""
-    data = await request.json()
-    
     branches = polling_manager.get_branches(
         repo_url=data.get('url', ''),
         platform=data.get('platform', 'gitlab'),
@@ -150,7 +146,7 @@ async def get_repo_branches(request: Request):
 
 
 @router.post("/repos/{repo_id}/clone")
-async def clone_repo(repo_id: str, background_tasks: BackgroundTasks):
+def clone_repo(repo_id: str, background_tasks: BackgroundTasks):
     """克隆仓库到本地"""
     repo = polling_manager.get_repo_obj(repo_id)
     if not repo:
@@ -162,7 +158,7 @@ async def clone_repo(repo_id: str, background_tasks: BackgroundTasks):
 
 
 @router.post("/repos/{repo_id}/trigger")
-async def trigger_repo_review(repo_id: str, request: Request, background_tasks: BackgroundTasks):
+def trigger_repo_review(repo_id: str, data: Optional[Dict[str, Any]] = Body(None)):
     """手动触发仓库审查"""
     repo = polling_manager.get_repo_obj(repo_id)
     if not repo:
@@ -172,12 +168,7 @@ async def trigger_repo_review(repo_id: str, request: Request, background_tasks:
         raise HTTPException(status_code=400, detail="仓库已禁用")
     
     # 获取审查类型（默认commit）
-    try:
-        data = await request.json()
-        strategy = data.get('strategy', 'commit')
-    except:
-        strategy = 'commit'
-    
+    strategy = (data or {}).get('strategy', 'commit')
     if strategy not in ['commit', 'merge_request']:
         strategy = 'commit'
     
@@ -218,35 +209,28 @@ async def trigger_repo_review(repo_id: str, request: Request, background_tasks:
         'target_branch': repo.branch,
     }
     
-    # 后台执行审查
-    run_aider_review = get_run_aider_review()
-    background_tasks.add_task(run_aider_review, clone_url, repo.branch, strategy, context)
+    # 提交到审查线程池后台执行
+    try:
+        submit_review(clone_url, repo.branch, strategy, context)
+    except QueueFullError as e:
+        # 提示客户端稍后重试
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
     
     strategy_text = 'Commit审查' if strategy == 'commit' else 'MR审查'
     return {"status": "triggered", "repo_id": repo_id, "strategy": strategy, "message": f"{strategy_text}任务已提交"}
 
 
 @router.post("/parse-url")
-async def parse_repo_url(request: Request):
+async def parse_repo_url(data: Dict[str, Any] = Body(...)):
     """解析仓库URL获取名称"""
-    data = await request.json()
     url = data.get('url', '')
     
-    # SSH格式: git@host:group/project.git
-    ssh_match = re.match(r'git@[^:]+:(.+?)(?:\.git)?$', url)
-    if ssh_match:
-        path = ssh_match.group(1)
-        name = path.split('/')[-1]
-        return {"name": name, "path": path}
-    
-    # HTTP格式: http(s)://host/group/project.git
-    http_match = re.match(r'https?://[^/]+/(.+?)(?:\.git)?$', url)
-    if http_match:
-        path = http_match.group(1)
+    # 复用 utils 中预编译的 SSH / HTTP 正则（结果按 URL 缓存）
+    path = extract_project_path(url)
+    if path:
         # 移除可能的用户名密码
         if '@' in path:
             path = path.split('@')[-1]
-        name = path.split('/')[-1]
-        return {"name": name, "path": path}
+        return {"name": path.split('/')[-1], "path": path}
     
     return {"name": "", "path": ""}
@@ -1,27 +1,30 @@
 """
 系统设置 API 路由
 """
-from fastapi import APIRouter, Request, HTTPException
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Body, HTTPException
+from pydantic import BaseModel
 
 from settings import SettingsManager
 
 router = APIRouter(prefix="/api/settings", tags=["Settings"])
 
 
+class SettingValue(BaseModel):
+    """单个设置请求体"""
+    value: Any = ""
+
+
 @router.get("")
-async def get_settings():
+def get_settings() -> List[Dict[str, Any]]:
     """获取所有系统设置"""
     return SettingsManager.get_all_with_meta()
 
 
 @router.post("")
-async def update_settings(request: Request):
-    """更新系统设置"""
-    payload = await request.json()
-    
-    if not isinstance(payload, dict):
-        raise HTTPException(status_code=400, detail="Invalid payload format")
-    
+def update_settings(payload: Dict[str, Any] = Body(...)):
+    """更新系统设置（请求体须为 JSON 对象，由 FastAPI 校验）"""
     success = SettingsManager.set_many(payload)
     if success:
         return {"status": "success", "message": "设置已保存"}
@@ -30,17 +33,16 @@ async def update_settings(request: Request):
 
 
 @router.get("/{key}")
-async def get_setting(key: str):
+def get_setting(key: str) -> Dict[str, Any]:
     """获取单个设置"""
     value = SettingsManager.get(key)
     return {"key": key, "value": value}
 
 
 @router.post("/{key}")
-async def set_setting(key: str, request: Request):
+def set_setting(key: str, payload: SettingValue):
     """设置单个配置"""
-    payload = await request.json()
-    value = payload.get("value", "")
+    value = payload.value
     
     success = SettingsManager.set(key, str(value))
     if success:
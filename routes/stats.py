@@ -1,55 +1,97 @@
 """
 统计 API 路由
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from database import get_db
-from statistics import StatisticsService
+from statistics import StatisticsService, bump_data_version, get_data_version
 from services.issue_parser import issue_parser, ParsedIssue
 from services.report_exporter import report_exporter
 
 router = APIRouter(prefix="/api/stats", tags=["Statistics"])
 
+# 仪表盘定时轮询的聚合统计接口：结果按 (接口, 参数) 缓存，审查数据版本变化或超过 TTL 后重新查询；
+# 响应带 ETag，浏览器用 If-None-Match 重新验证，内容未变时返回 304
+_STATS_CACHE_TTL = 30
+# 缓存键 -> (数据版本号, 过期时间 monotonic, ETag, 响应体)；days / limit 参数有上下限，缓存键数量有界
+_stats_cache: Dict[Tuple, Tuple[int, float, str, bytes]] = {}
+_MAX_DAYS = 365
+_MAX_LIMIT = 100
+
+
+def _cached_stats(request: Request, key: Tuple, compute: Callable[[], Any]) -> Response:
+    """返回缓存的统计结果（JSON），支持 ETag 条件请求"""
+    version = get_data_version()
+    now = time.monotonic()
+    entry = _stats_cache.get(key)
+    if entry is None or entry[0] != version or entry[1] <= now:
+        body = json.dumps(jsonable_encoder(compute()), ensure_ascii=False, separators=(',', ':')).encode()
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        entry = _stats_cache[key] = (version, now + _STATS_CACHE_TTL, etag, body)
+    
+    headers = {"ETag": entry[2], "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == entry[2]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry[3], media_type="application/json", headers=headers)
+
 
 @router.get("/overview")
-async def get_overview(db: Session = Depends(get_db)):
+def get_overview(request: Request, db: Session = Depends(get_db)) -> Response:
     """获取概览统计"""
     service = StatisticsService(db)
-    return service.get_overview()
+    return _cached_stats(request, ("overview",), service.get_overview)
 
 
 @router.get("/daily-trend")
-async def get_daily_trend(days: int = 30, db: Session = Depends(get_db)):
+def get_daily_trend(
+    request: Request,
+    days: int = Query(30, ge=1, le=_MAX_DAYS),
+    db: Session = Depends(get_db)
+) -> Response:
     """获取每日审查趋势"""
     service = StatisticsService(db)
-    return service.get_daily_trend(days)
+    return _cached_stats(request, ("daily-trend", days), lambda: service.get_daily_trend(days))
 
 
 @router.get("/authors")
-async def get_authors(limit: int = 20, db: Session = Depends(get_db)):
+def get_authors(
+    request: Request,
+    limit: int = Query(20, ge=1, le=_MAX_LIMIT),
+    db: Session = Depends(get_db)
+) -> Response:
     """获取提交人统计"""
     service = StatisticsService(db)
-    return service.get_author_statistics(limit)
+    return _cached_stats(request, ("authors", limit), lambda: service.get_author_statistics(limit))
 
 
 @router.get("/author/{author_name}")
-async def get_author_detail(author_name: str, db: Session = Depends(get_db)):
+def get_author_detail(author_name: str, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """获取指定提交人详情"""
     service = StatisticsService(db)
     return service.get_author_detail(author_name)
 
 
 @router.get("/projects")
-async def get_projects(limit: int = 20, db: Session = Depends(get_db)):
+def get_projects(
+    request: Request,
+    limit: int = Query(20, ge=1, le=_MAX_LIMIT),
+    db: Session = Depends(get_db)
+) -> Response:
     """获取项目统计"""
     service = StatisticsService(db)
-    return service.get_project_statistics(limit)
+    return _cached_stats(request, ("projects", limit), lambda: service.get_project_statistics(limit))
 
 
 @router.get("/reviews")
-async def get_reviews(
+def get_reviews(
     limit: int = 50, 
     offset: int = 0,
     search: str = None,
@@ -60,7 +102,7 @@ async def get_reviews(
     sort_by: str = Query('created_at', regex="^(created_at|quality_score|issues_count|project_name|author_name)$"),
     order: str = Query('desc', regex="^(asc|desc)$"),
     db: Session = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     获取审查记录列表（支持搜索、过滤和排序）
     
@@ -81,7 +123,7 @@ async def get_reviews(
 
 
 @router.delete("/review/{task_id}")
-async def delete_review(task_id: str, db: Session = Depends(get_db)):
+def delete_review(task_id: str, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """删除审查记录"""
     from models import ReviewRecord
     
@@ -91,12 +133,14 @@ async def delete_review(task_id: str, db: Session = Depends(get_db)):
     
     db.delete(review)
     db.commit()
+    # 使统计缓存失效，聚合接口不再返回已删除的记录
+    bump_data_version()
     
     return {"status": "deleted", "task_id": task_id}
 
 
 @router.get("/review/{task_id}")
-async def get_review_detail(task_id: str, db: Session = Depends(get_db)):
+def get_review_detail(task_id: str, db: Session = Depends(get_db)) -> Dict[str, Any]:
     """获取审查详情"""
     service = StatisticsService(db)
     result = service.get_review_detail(task_id)
@@ -106,23 +150,27 @@ async def get_review_detail(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/hotspots")
-async def get_hotspots(limit: int = 20, db: Session = Depends(get_db)):
+def get_hotspots(
+    request: Request,
+    limit: int = Query(20, ge=1, le=_MAX_LIMIT),
+    db: Session = Depends(get_db)
+) -> Response:
     """获取问题热点文件"""
     service = StatisticsService(db)
-    return service.get_issue_hotspots(limit)
+    return _cached_stats(request, ("hotspots", limit), lambda: service.get_issue_hotspots(limit))
 
 
 @router.get("/categories")
-async def get_categories(db: Session = Depends(get_db)):
+def get_categories(request: Request, db: Session = Depends(get_db)) -> Response:
     """获取问题类型分布"""
     service = StatisticsService(db)
-    return service.get_issue_categories()
+    return _cached_stats(request, ("categories",), service.get_issue_categories)
 
 
 # ==================== 审查详情增强 API ====================
 
 @router.get("/review/{task_id}/issues")
-async def get_review_issues(task_id: str, db: Session = Depends(get_db)):
+def get_review_issues(task_id: str, db: Session = Depends(get_db)):
     """获取解析后的问题列表"""
     service = StatisticsService(db)
     review = service.get_review_detail(task_id)
@@ -141,7 +189,7 @@ async def get_review_issues(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/review/{task_id}/summary")
-async def get_review_summary(task_id: str, db: Session = Depends(get_db)):
+def get_review_summary(task_id: str, db: Session = Depends(get_db)):
     """获取审查总结"""
     service = StatisticsService(db)
     review = service.get_review_detail(task_id)
@@ -171,7 +219,7 @@ async def get_review_summary(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/review/{task_id}/export")
-async def export_review_report(
+def export_review_report(
     task_id: str, 
     format: str = "md",
     db: Session = Depends(get_db)
@@ -211,7 +259,7 @@ async def export_review_report(
 
 
 @router.get("/review/{task_id}/full")
-async def get_review_full(task_id: str, db: Session = Depends(get_db)):
+def get_review_full(task_id: str, db: Session = Depends(get_db)):
     """获取完整审查详情（包含解析后的问题和总结）"""
     service = StatisticsService(db)
     review = service.get_review_detail(task_id)
@@ -4,19 +4,29 @@
 import re
 import subprocess
 import time
+from typing import Optional, Tuple
 
 import requests
 from fastapi import APIRouter
 
 from settings import SettingsManager
+from utils import build_git_auth
 
 router = APIRouter(prefix="/api/test", tags=["Testing"])
 
+# 以下接口都包含阻塞的网络请求或子进程调用，声明为普通 def 由线程池执行，不占用事件循环
+
+_VERSION_RE = re.compile(r'[\d.]+')
+
+# Aider 版本检测结果缓存：(time.monotonic() 检测时刻, 响应)，只缓存成功结果
+_AIDER_CACHE_TTL = 300
+_aider_cache: Optional[Tuple[float, dict]] = None
+
 
 @router.post("/git")
-async def test_git_connection():
+def test_git_connection():
     """测试Git平台连接"""
-    start_time = time.time()
+    start_time = time.monotonic()
     
     settings = SettingsManager.get_all()
     platform = settings.get('git_platform', 'gitlab')
@@ -52,22 +62,13 @@ async def test_git_connection():
         else:
             # 验证API连接
             try:
-                if platform == 'gitlab':
-                    url = f"{api_url}/user"
-                    headers = {"PRIVATE-TOKEN": token}
-                elif platform == 'gitea':
-                    url = f"{api_url}/user"
-                    headers = {"Authorization": f"token {token}"}
-                elif platform == 'github':
-                    url = f"{api_url}/user"
-                    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"}
-                else:
+                # 各平台的认证请求头与评论回写共用同一张表，/user 接口路径相同
+                headers = build_git_auth(platform, token=token)["headers"]
+                if not headers:
                     results.append(f"✗ 不支持的平台: {platform}")
                     overall_success = False
-                    url = None
-                
-                if url:
-                    response = requests.get(url, headers=headers, timeout=10)
+                else:
+                    response = requests.get(f"{api_url}/user", headers=headers, timeout=10)
                     response.raise_for_status()
                     user_data = response.json()
                     username = user_data.get('username') or user_data.get('login') or user_data.get('name', 'Unknown')
@@ -88,7 +89,7 @@ async def test_git_connection():
     else:
         results.append("ℹ 评论回写已关闭，跳过API验证")
     
-    elapsed = round(time.time() - start_time, 2)
+    elapsed = round(time.monotonic() - start_time, 2)
     
     return {
         "success": overall_success,
@@ -103,9 +104,9 @@ async def test_git_connection():
 
 
 @router.post("/vllm")
-async def test_vllm_connection():
+def test_vllm_connection():
     """测试vLLM模型连接 - 发送真实对话验证"""
-    start_time = time.time()
+    start_time = time.monotonic()
     
     settings = SettingsManager.get_all()
     api_base = settings.get('vllm_api_base', '')
@@ -141,7 +142,7 @@ async def test_vllm_connection():
         response.raise_for_status()
         
         result = response.json()
-        elapsed = round(time.time() - start_time, 2)
+        elapsed = round(time.monotonic() - start_time, 2)
         
         # 提取模型回复
         reply = ""
@@ -159,7 +160,7 @@ async def test_vllm_connection():
             }
         }
     except requests.exceptions.Timeout:
-        elapsed = round(time.time() - start_time, 2)
+        elapsed = round(time.monotonic() - start_time, 2)
         return {"success": False, "message": f"模型响应超时 ({elapsed}s)", "details": {"api_base": api_base, "model": model_name}}
     except requests.exceptions.ConnectionError:
         return {"success": False, "message": "无法连接到vLLM服务器", "details": {"api_base": api_base}}
@@ -175,8 +176,13 @@ async def test_vllm_connection():
 
 
 @router.post("/aider")
-async def test_aider():
-    """测试Aider是否可用"""
+def test_aider(refresh: bool = False):
+    """测试Aider是否可用（成功结果缓存 5 分钟，refresh=true 强制重新检测）"""
+    global _aider_cache
+    cached = _aider_cache
+    if cached and not refresh and time.monotonic() - cached[0] < _AIDER_CACHE_TTL:
+        return cached[1]
+    
     try:
         result = subprocess.run(
             ["aider", "--version"],
@@ -188,16 +194,18 @@ async def test_aider():
         if result.returncode == 0:
             version = result.stdout.strip() or result.stderr.strip()
             # 提取版本号
-            version_match = re.search(r'[\d.]+', version)
+            version_match = _VERSION_RE.search(version)
             version_str = version_match.group(0) if version_match else version[:50]
             
-            return {
+            response = {
                 "success": True,
                 "message": "Aider 可用",
                 "details": {
                     "version": version_str
                 }
             }
+            _aider_cache = (time.monotonic(), response)
+            return response
         else:
             # 提供更详细的错误信息
             error_msg = result.stderr.strip() if result.stderr else result.stdout.strip()
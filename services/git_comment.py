@@ -1,19 +1,44 @@
 """
 Git 评论回写服务
 """
-import requests
+from typing import Dict, Optional
 from urllib.parse import quote
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from settings import SettingsManager
 from utils import logger, build_git_auth
 
+# 复用连接的会话，显式接受压缩响应
+_http = requests.Session()
+_http.headers['Accept-Encoding'] = 'gzip, deflate'
+# 连接池按并发审查数放大；POST 不在默认重试方法内，收到响应后不会重发，避免重复评论
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+)
+_http.mount('http://', _adapter)
+_http.mount('https://', _adapter)
+# (连接, 读取) 超时（秒），Git 服务端无响应时不会一直占住审查线程
+_TIMEOUT = (5, 30)
 
-def post_comment_to_git(context: dict, report: str):
-    """回写评论到Git平台"""
+# 评论接口地址模板
+_GITLAB_MR_NOTES_URL = "{api}/projects/{pid}/merge_requests/{iid}/notes"
+_GITLAB_COMMIT_COMMENTS_URL = "{api}/projects/{pid}/repository/commits/{sha}/comments"
+_PR_COMMENTS_URL = "{api}/repos/{owner}/{repo}/issues/{num}/comments"  # Gitea / GitHub 共用
+_GITHUB_COMMIT_COMMENTS_URL = "{api}/repos/{owner}/{repo}/commits/{sha}/comments"
+
+
+def post_comment_to_git(context: dict, report: str, settings: Optional[Dict[str, str]] = None):
+    """回写评论到Git平台，settings 为调用方已获取的配置快照"""
     platform = context.get('platform', 'gitlab')
     
     # 优先使用仓库级认证信息和API地址
-    settings = SettingsManager.get_all()
+    if settings is None:
+        settings = SettingsManager.get_all()
     token = context.get('repo_token', '') or settings.get('git_token', '')
     http_user = context.get('repo_http_user', '') or settings.get('git_http_user', '')
     http_password = context.get('repo_http_password', '') or settings.get('git_http_password', '')
@@ -30,15 +55,13 @@ def post_comment_to_git(context: dict, report: str):
         logger.warning("未配置认证信息（Token或HTTP用户名/密码），无法回写评论")
         return
     
+    poster = _POSTERS.get(platform)
+    if poster is None:
+        logger.warning(f"不支持的Git平台: {platform}")
+        return
+    
     try:
-        if platform == "gitlab":
-            post_gitlab_comment(context, report, api_url, auth_info)
-        elif platform == "gitea":
-            post_gitea_comment(context, report, api_url, auth_info)
-        elif platform == "github":
-            post_github_comment(context, report, api_url, auth_info)
-        else:
-            logger.warning(f"不支持的Git平台: {platform}")
+        poster(context, report, api_url, auth_info)
     except Exception as e:
         logger.exception(f"回写评论失败: {e}")
 
@@ -49,21 +72,23 @@ def post_gitlab_comment(context: dict, report: str, api_url: str, auth_info: dic
     project_id = quote(context.get('project_id', ''), safe='')
     
     if context['strategy'] == 'merge_request':
-        url = f"{api_url}/projects/{project_id}/merge_requests/{context['mr_iid']}/notes"
-        response = requests.post(
+        url = _GITLAB_MR_NOTES_URL.format(api=api_url, pid=project_id, iid=context['mr_iid'])
+        response = _http.post(
             url, 
             headers=auth_info['headers'], 
             auth=auth_info['auth'],
+            timeout=_TIMEOUT,
             json={"body": report}
         )
         response.raise_for_status()
         logger.info(f"评论已发送到GitLab MR#{context['mr_iid']}")
     else:
-        url = f"{api_url}/projects/{project_id}/repository/commits/{context['commit_id']}/comments"
-        response = requests.post(
+        url = _GITLAB_COMMIT_COMMENTS_URL.format(api=api_url, pid=project_id, sha=context['commit_id'])
+        response = _http.post(
             url, 
             headers=auth_info['headers'],
             auth=auth_info['auth'],
+            timeout=_TIMEOUT,
             json={"note": report}
         )
         response.raise_for_status()
@@ -81,11 +106,12 @@ def post_gitea_comment(context: dict, report: str, api_url: str, auth_info: dict
     
     if context['strategy'] == 'merge_request':
         pr_number = context.get('pr_number', context.get('mr_iid'))
-        url = f"{api_url}/repos/{repo_owner}/{repo_name}/issues/{pr_number}/comments"
-        response = requests.post(
+        url = _PR_COMMENTS_URL.format(api=api_url, owner=repo_owner, repo=repo_name, num=pr_number)
+        response = _http.post(
             url, 
             headers=auth_info['headers'],
             auth=auth_info['auth'],
+            timeout=_TIMEOUT,
             json={"body": report}
         )
         response.raise_for_status()
@@ -105,22 +131,37 @@ def post_github_comment(context: dict, report: str, api_url: str, auth_info: dic
     
     if context['strategy'] == 'merge_request':
         pr_number = context.get('pr_number', context.get('mr_iid'))
-        url = f"{api_url}/repos/{repo_owner}/{repo_name}/issues/{pr_number}/comments"
-        response = requests.post(
+        url = _PR_COMMENTS_URL.format(api=api_url, owner=repo_owner, repo=repo_name, num=pr_number)
+        response = _http.post(
             url, 
             headers=auth_info['headers'],
             auth=auth_info['auth'],
+            timeout=_TIMEOUT,
             json={"body": report}
         )
         response.raise_for_status()
         logger.info(f"评论已发送到GitHub PR#{pr_number}")
     else:
-        url = f"{api_url}/repos/{repo_owner}/{repo_name}/commits/{context['commit_id']}/comments"
-        response = requests.post(
+        url = _GITHUB_COMMIT_COMMENTS_URL.format(api=api_url, owner=repo_owner, repo=repo_name, sha=context['commit_id'])
+        response = _http.post(
             url, 
             headers=auth_info['headers'],
             auth=auth_info['auth'],
+            timeout=_TIMEOUT,
             json={"body": report}
         )
         response.raise_for_status()
         logger.info(f"评论已发送到GitHub Commit {context['commit_id'][:8]}")
+
+
+def close():
+    """关闭连接池（服务停止时调用）"""
+    _http.close()
+
+
+# 平台 -> 评论发送函数
+_POSTERS = {
+    "gitlab": post_gitlab_comment,
+    "gitea": post_gitea_comment,
+    "github": post_github_comment,
+}
@@ -0,0 +1,154 @@
+"""
+仓库镜像缓存
+
+每个仓库在缓存目录下保留一个浅克隆、无 blob 的裸仓库，审查任务以 worktree 方式检出，
+首次之后只做增量 fetch，任务结束删除 worktree 即可，不再重复完整克隆；
+镜像长期保留在磁盘上，origin 只记录不含认证信息的地址，认证信息每次通过环境变量传给 git
+"""
+import base64
+import hashlib
+import os
+import re
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+from git import GitCommandError, Repo
+
+from config import config
+from utils import logger
+
+# 浅克隆深度：覆盖近期提交及其父提交，不足时按需加深
+CLONE_DEPTH = 50
+
+# sparse-checkout（非 cone 模式）模式中需要转义的通配字符
+_SPARSE_SPECIAL_RE = re.compile(r'([\\*?\[])')
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _mirror_dir(repo_url: str) -> str:
+    """仓库镜像目录（按不含认证信息的仓库地址哈希）"""
+    digest = hashlib.sha1(repo_url.encode()).hexdigest()
+    return os.path.join(config.server.repo_cache_dir, digest)
+
+
+def _split_auth(clone_url: str) -> Tuple[str, Dict[str, str]]:
+    """
+    拆分带认证信息的地址：返回不含认证信息的地址，以及以 http.extraHeader 传递认证的 git 环境变量
+    （GIT_CONFIG_COUNT 配置只存在于子进程环境中，不写入镜像的 config）
+    """
+    parsed = urlsplit(clone_url)
+    if parsed.scheme not in ('http', 'https') or '@' not in parsed.netloc:
+        return clone_url, {}
+    userinfo, _, host = parsed.netloc.rpartition('@')
+    user, _, password = userinfo.partition(':')
+    credentials = base64.b64encode(f"{unquote(user)}:{unquote(password)}".encode()).decode()
+    env = {
+        'GIT_CONFIG_COUNT': '1',
+        'GIT_CONFIG_KEY_0': 'http.extraHeader',
+        'GIT_CONFIG_VALUE_0': f'Authorization: Basic {credentials}',
+    }
+    return urlunsplit(parsed._replace(netloc=host)), env
+
+
+def get_lock(repo_url: str) -> threading.Lock:
+    """获取仓库镜像锁，同一镜像的 fetch / worktree 操作需串行执行"""
+    with _locks_guard:
+        lock = _locks.get(repo_url)
+        if lock is None:
+            lock = _locks[repo_url] = threading.Lock()
+        return lock
+
+
+def fetch_branch(repo: Repo, branch: str, *args: str):
+    """拉取远程分支到 refs/remotes/origin/<branch>（镜像与 worktree 共享引用）"""
+    repo.git.fetch(
+        *args, f'--depth={CLONE_DEPTH}', '--no-tags', 'origin',
+        f'+refs/heads/{branch}:refs/remotes/origin/{branch}'
+    )
+
+
+def deepen_branch(repo: Repo, branch: str):
+    """在现有浅克隆基础上加深分支历史"""
+    repo.git.fetch(
+        f'--deepen={CLONE_DEPTH}', '--no-tags', 'origin',
+        f'+refs/heads/{branch}:refs/remotes/origin/{branch}'
+    )
+
+
+def checkout_worktree(repo_url: str, clone_url: str, branch: str, work_dir: str) -> Repo:
+    """
+    更新仓库镜像并在 work_dir 创建指向分支最新提交的 worktree（detached，暂不检出文件），
+    变更文件列表只需比较 tree，确定要审查的文件后再调用 populate_worktree 检出；
+    返回的 Repo 已带上本次的认证环境，后续 fetch 和按需下载 blob 无需再传认证信息；
+    调用方需持有 get_lock(repo_url)
+    """
+    mirror_dir = _mirror_dir(repo_url)
+    fetch_url, auth_env = _split_auth(clone_url)
+
+    if os.path.isdir(mirror_dir):
+        mirror = Repo(mirror_dir)
+        # 以不含认证信息的地址覆盖 origin（旧版本镜像中可能残留认证地址）
+        mirror.git.remote('set-url', 'origin', fetch_url)
+        mirror.git.worktree('prune')
+        logger.info(f"更新仓库镜像: {repo_url} ({branch})")
+    else:
+        os.makedirs(config.server.repo_cache_dir, exist_ok=True)
+        logger.info(f"创建仓库镜像: {repo_url} -> {mirror_dir}")
+        try:
+            mirror = Repo.clone_from(fetch_url, mirror_dir, env=auth_env, bare=True, multi_options=[
+                f'--depth={CLONE_DEPTH}',
+                '--single-branch',
+                f'--branch={branch}',
+                '--filter=blob:none',
+                '--no-tags',
+            ])
+        except Exception:
+            # 不保留半成品镜像，下次重新克隆
+            shutil.rmtree(mirror_dir, ignore_errors=True)
+            raise
+
+    mirror.git.update_environment(**auth_env)
+    fetch_branch(mirror, branch)
+    mirror.git.worktree('add', '--detach', '--no-checkout', work_dir, f'origin/{branch}')
+    repo = Repo(work_dir)
+    repo.git.update_environment(**auth_env)
+    return repo
+
+
+def populate_worktree(repo: Repo, files: Optional[List[str]] = None):
+    """
+    检出 worktree 文件：files 为空时检出全部（RepoMap 需要全仓库），
+    否则通过 sparse-checkout 只检出并按需下载这些文件，调用方需持有 get_lock(repo_url)
+    """
+    if not files:
+        repo.git.reset('--hard', '--quiet')
+        return
+
+    # 不用 git sparse-checkout 命令：它会开启 extensions.worktreeConfig 并把镜像的 core.bare
+    # 移到 config.worktree，GitPython 读不到后会把镜像误判为非裸仓库。
+    # 这里只写本 worktree 的 info/sparse-checkout，并仅在本次检出时启用，索引中的
+    # skip-worktree 标记在之后的 git 操作中仍然生效
+    info_dir = os.path.join(repo.git_dir, 'info')
+    os.makedirs(info_dir, exist_ok=True)
+    with open(os.path.join(info_dir, 'sparse-checkout'), 'w', encoding='utf-8') as fp:
+        fp.writelines('/' + _SPARSE_SPECIAL_RE.sub(r'\\\1', f) + '\n' for f in files)
+    repo.git(c='core.sparseCheckout=true').reset('--hard', '--quiet')
+
+
+def remove_worktree(repo_url: str, work_dir: str):
+    """删除任务 worktree，保留镜像供后续任务复用"""
+    mirror_dir = _mirror_dir(repo_url)
+    with get_lock(repo_url):
+        try:
+            if os.path.isdir(mirror_dir):
+                Repo(mirror_dir).git.worktree('remove', '--force', work_dir)
+        except GitCommandError as e:
+            logger.warning(f"删除 worktree 失败，直接清理目录: {e}")
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir, ignore_errors=True)
+            if os.path.isdir(mirror_dir):
+                Repo(mirror_dir).git.worktree('prune')
@@ -6,17 +6,21 @@ import re
 import json
 import shutil
 import subprocess
+import tempfile
+import threading
 import time
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Set, Tuple
 
-from git import Repo
+from git import GitCommandError, Repo
+from sqlalchemy import insert, select, update
 
 from config import config
-from database import get_db_session
-from models import ReviewRecord, ReviewStatus, ReviewStrategy
+from database import bulk_insert_issues, get_db_session
+from models import IssueSeverity, ReviewRecord, ReviewStatus, ReviewStrategy
 from settings import SettingsManager
+from statistics import bump_data_version
 from utils import (
     logger,
     parse_aider_output,
@@ -29,7 +33,71 @@ from utils import (
     split_files_by_tokens,
     merge_batch_reports
 )
+from services import repo_cache
 from services.git_comment import post_comment_to_git
+from services.issue_parser import issue_parser
+
+_MAX_DEEPEN_ROUNDS = 4
+
+# 审查记录中保存的文件列表上限（仪表盘只展示列表，总数见 files_count），限制单行大小
+_MAX_FILES_STORED = 500
+
+# Aider 输出读取上限：超出时只保留末尾（审查报告在输出末尾），避免异常冗长的输出占满内存
+_MAX_OUTPUT_BYTES = 8 * 1024 * 1024
+
+# Aider 失败后重试前的等待时间（秒）
+_RETRY_DELAY = 2
+
+# 运行中的 Aider 子进程，服务停止时统一终止
+_procs: Set[subprocess.Popen] = set()
+_procs_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+class ReviewCancelled(Exception):
+    """服务停止，审查任务被取消"""
+
+# 问题分级关键词：c=严重, w=警告, s=建议
+_ISSUE_RE = re.compile(
+    r'(?P<c>🔴|严重|critical|error|security|漏洞|危险)|'
+    r'(?P<w>🟡|警告|warning|注意|问题)|'
+    r'(?P<s>🔵|建议|suggestion|优化|改进|recommend)',
+    re.IGNORECASE
+)
+
+
+def _shallow_commits(repo: Repo) -> Set[str]:
+    """浅克隆边界提交（父提交未获取），直接读取镜像的 shallow 文件，不启动 git 进程"""
+    try:
+        with open(os.path.join(repo.common_dir, 'shallow'), encoding='ascii') as fp:
+            return set(fp.read().split())
+    except FileNotFoundError:
+        return set()
+
+
+def _diff_commit(repo: Repo, commit_id: str) -> Tuple[str, List[str]]:
+    """一次 diff-tree 同时取得提交时间（ISO 8601）和变更文件列表"""
+    output = repo.git.diff_tree('-r', '-z', '--name-only', '--always', '--format=%cI', commit_id)
+    header, _, files = output.partition('\0')
+    if files.startswith('\n'):
+        files = files[1:]
+    return header.strip(), _split_z(files)
+
+
+def _commit_changes(repo: Repo, branch: str, commit_id: str) -> Tuple[str, List[str]]:
+    """
+    获取 commit 的提交时间和变更文件；commit 未获取或位于浅克隆边界
+    （缺少父提交时 diff-tree 会得到空列表）时先加深历史
+    """
+    for _ in range(_MAX_DEEPEN_ROUNDS):
+        if commit_id not in _shallow_commits(repo):
+            try:
+                return _diff_commit(repo, commit_id)
+            except GitCommandError:
+                pass
+        logger.info(f"Commit {commit_id[:8]} 超出浅克隆深度，加深 {repo_cache.CLONE_DEPTH} 层")
+        repo_cache.deepen_branch(repo, branch)
+    return _diff_commit(repo, commit_id)
 
 
 def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
@@ -44,12 +112,21 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
     task_id = str(uuid.uuid4())
     work_dir = os.path.join(config.server.work_dir_base, task_id)
     start_time = datetime.utcnow()
+    # 耗时按单调时钟计算，不受系统时间调整影响；datetime 只用于写入开始/结束时间
+    started = time.monotonic()
     
     logger.info(f"开始审查任务 {task_id}, 策略: {strategy}")
     
-    # 创建审查记录
+    # 整个任务使用同一份已解析的配置快照，避免反复读取和类型转换
+    cfg = SettingsManager.snapshot()
+    settings = cfg.raw
+    # 同一仓库镜像的 git 操作串行执行，Aider 运行期间释放
+    mirror_lock = repo_cache.get_lock(repo_url)
+    mirror_locked = False
+    
+    # 创建审查记录（Core INSERT，不构造 ORM 对象），记下主键供写入问题详情时使用
     with get_db_session() as db:
-        record = ReviewRecord(
+        review_id = db.execute(insert(ReviewRecord).values(
             task_id=task_id,
             strategy=ReviewStrategy.COMMIT if strategy == "commit" else ReviewStrategy.MERGE_REQUEST,
             status=ReviewStatus.PROCESSING,
@@ -63,9 +140,10 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             author_name=context.get('author_name'),
             author_email=context.get('author_email'),
             started_at=start_time,
-        )
-        db.add(record)
-        db.commit()
+        )).inserted_primary_key[0]
+    bump_data_version()
+    # 审查过程中确定、需随下一次记录更新一并写入的字段
+    record_values = {}
     
     try:
         # 1. 克隆代码到沙盒
@@ -73,11 +151,10 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             shutil.rmtree(work_dir)
         
         # 优先使用仓库级认证信息
-        settings = SettingsManager.get_all()
-        git_http_user = context.get('repo_http_user') or settings.get('git_http_user', '')
-        git_http_password = context.get('repo_http_password') or settings.get('git_http_password', '')
-        git_token = context.get('repo_token') or settings.get('git_token', '')
-        git_server_url = settings.get('git_server_url', '')
+        git_http_user = context.get('repo_http_user') or cfg.git_http_user
+        git_http_password = context.get('repo_http_password') or cfg.git_http_password
+        git_token = context.get('repo_token') or cfg.git_token
+        git_server_url = cfg.git_server_url
         
         # 转换为HTTP认证URL（支持用户名密码或Token）
         clone_url = repo_url
@@ -91,9 +168,10 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             )
             logger.info(f"使用Git认证信息克隆仓库")
         
-        logger.info(f"克隆仓库: {repo_url} -> {work_dir}")
-        repo = Repo.clone_from(clone_url, work_dir)
-        repo.git.checkout(branch)
+        logger.info(f"检出仓库: {repo_url} -> {work_dir}")
+        mirror_lock.acquire()
+        mirror_locked = True
+        repo = repo_cache.checkout_worktree(repo_url, clone_url, branch, work_dir)
         
         # 2. 根据策略获取变更文件和构建Prompt
         target_files = []
@@ -101,30 +179,44 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
         
         if strategy == "commit":
             commit_id = context['commit_id']
-            
-            # 检查生效时间 - 跳过在 effective_time 之前的提交
+            # 排队期间合并的多个 Commit 一起审查，变更文件取并集
+            commit_ids = context.get('batch_commit_ids') or [commit_id]
             effective_time_str = context.get('effective_time', '')
-            if effective_time_str:
-                try:
-                    from datetime import datetime
-                    # 获取 commit 时间
-                    commit_time_str = repo.git.log('-1', '--format=%ci', commit_id)
-                    commit_time = datetime.fromisoformat(commit_time_str.strip().replace(' ', 'T').replace(' +', '+'))
-                    effective_time = datetime.fromisoformat(effective_time_str.replace('Z', '+00:00'))
-                    
-                    if commit_time < effective_time:
-                        logger.info(f"Commit {commit_id[:8]} 时间 {commit_time} 早于生效时间 {effective_time}，跳过审查")
-                        finalize_review(task_id, start_time, f"ℹ️ Commit 在生效时间之前，已跳过审查。", 0, 0, 0, 0)
-                        return
-                except Exception as e:
-                    logger.warning(f"解析生效时间失败，继续审查: {e}")
             
-            diff_files = repo.git.diff_tree(
-                '--no-commit-id', '--name-only', '-r', commit_id
-            ).splitlines()
+            diff_files = []
+            reviewed_ids = []
+            for cid in commit_ids:
+                commit_time_str, files = _commit_changes(repo, branch, cid)
+                
+                # 检查生效时间 - 跳过在 effective_time 之前的提交
+                if effective_time_str:
+                    try:
+                        commit_time = datetime.fromisoformat(commit_time_str)
+                        effective_time = datetime.fromisoformat(effective_time_str.replace('Z', '+00:00'))
+                        
+                        if commit_time < effective_time:
+                            logger.info(f"Commit {cid[:8]} 时间 {commit_time} 早于生效时间 {effective_time}，跳过审查")
+                            continue
+                    except Exception as e:
+                        logger.warning(f"解析生效时间失败，继续审查: {e}")
+                
+                reviewed_ids.append(cid)
+                diff_files.extend(files)
+            
+            if not reviewed_ids:
+                finalize_review(task_id, started, f"ℹ️ Commit 在生效时间之前，已跳过审查。", 0, 0, 0, 0)
+                return
+            if len(commit_ids) > 1:
+                diff_files = list(dict.fromkeys(diff_files))
+                context['reviewed_commit_ids'] = reviewed_ids
+            # worktree 位于分支最新提交，包含全部合并的 Commit：评论和审查记录都落在最新的已审查 Commit 上
+            if reviewed_ids[-1] != commit_id:
+                commit_id = context['commit_id'] = reviewed_ids[-1]
+                record_values['commit_id'] = commit_id
+            
             target_files = diff_files
             prompt = get_commit_prompt()
-            logger.info(f"Commit {commit_id[:8]} 变更了 {len(diff_files)} 个文件")
+            logger.info(f"Commit {', '.join(c[:8] for c in reviewed_ids)} 共变更了 {len(diff_files)} 个文件")
             
         elif strategy == "merge_request":
             target_branch = context['target_branch']
@@ -135,8 +227,9 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
                 try:
                     # fetch MR 的源分支 ref
                     logger.info(f"Fetching MR source: {source_ref}")
-                    repo.git.fetch('origin', f'{source_ref}:mr_branch')
-                    repo.git.checkout('mr_branch')
+                    # 镜像的分支被多个 worktree 共享，MR 源以 detached 方式检出
+                    repo.git.fetch(f'--depth={repo_cache.CLONE_DEPTH}', '--no-tags', 'origin', source_ref)
+                    repo.git.update_ref('--no-deref', 'HEAD', 'FETCH_HEAD')
                     logger.info(f"Checked out to MR source branch")
                 except Exception as e:
                     logger.warning(f"Fetch MR source ref 失败，尝试使用当前分支: {e}")
@@ -145,7 +238,6 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             effective_time_str = context.get('effective_time', '')
             if effective_time_str:
                 try:
-                    from datetime import datetime
                     # 获取当前分支最新 commit 时间
                     commit_time_str = repo.git.log('-1', '--format=%ci')
                     commit_time = datetime.fromisoformat(commit_time_str.strip().replace(' ', 'T').replace(' +', '+'))
@@ -153,52 +245,55 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
                     
                     if commit_time < effective_time:
                         logger.info(f"MR 最新提交时间 {commit_time} 早于生效时间 {effective_time}，跳过审查")
-                        finalize_review(task_id, start_time, f"ℹ️ MR 最新提交在生效时间之前，已跳过审查。", 0, 0, 0, 0)
+                        finalize_review(task_id, started, f"ℹ️ MR 最新提交在生效时间之前，已跳过审查。", 0, 0, 0, 0)
                         return
                 except Exception as e:
                     logger.warning(f"解析生效时间失败，继续审查: {e}")
             
-            # 获取相对于目标分支的变更文件
-            diff_files = repo.git.diff(
-                '--name-only', f"origin/{target_branch}"
-            ).splitlines()
+            # 镜像只包含拉取过的分支，单独拉取目标分支
+            if target_branch != branch:
+                repo_cache.fetch_branch(repo, target_branch)
+            
+            # 获取相对于目标分支的变更文件（比较两个 tree，无需检出文件）
+            diff_files = _split_z(repo.git.diff(
+                '--name-only', '-z', f"origin/{target_branch}", 'HEAD'
+            ))
             target_files = diff_files
             prompt = get_mr_prompt(target_branch)
             logger.info(f"MR相对于 {target_branch} 变更了 {len(diff_files)} 个文件")
-
-
         
         # 3. 过滤有效代码文件
         valid_files = filter_valid_files(target_files, config.aider.valid_extensions)
         
-        # 更新文件数到数据库
-        with get_db_session() as db:
-            record = db.query(ReviewRecord).filter(ReviewRecord.task_id == task_id).first()
-            if record:
-                record.files_count = len(valid_files)
-                record.files_reviewed = json.dumps(valid_files)
+        files_values = {'files_count': len(valid_files), 'files_reviewed': valid_files[:_MAX_FILES_STORED], **record_values}
+        aider_no_repo_map = cfg.aider_no_repo_map
+        
+        # 检出文件：禁用 RepoMap 时 Aider 只读取待审查文件，只检出这些文件
+        if valid_files:
+            repo_cache.populate_worktree(repo, valid_files if aider_no_repo_map else None)
+        mirror_lock.release()
+        mirror_locked = False
         
         if not valid_files:
             logger.warning("没有有效的代码文件需要审查")
-            finalize_review(task_id, start_time, "ℹ️ 本次变更未包含需要审查的代码文件。", 0, 0, 0, 0)
+            finalize_review(task_id, started, "ℹ️ 本次变更未包含需要审查的代码文件。", 0, 0, 0, 0, **files_values)
             # 检查是否启用评论
-            if SettingsManager.get_bool('enable_comment', True):
-                post_comment_to_git(context, "ℹ️ 本次变更未包含需要审查的代码文件。")
+            if cfg.enable_comment:
+                post_comment_to_git(context, "ℹ️ 本次变更未包含需要审查的代码文件。", settings)
             return
         
         logger.info(f"将审查 {len(valid_files)} 个代码文件: {valid_files}")
         
         # 4. 获取配置
-        vllm_api_base = settings.get('vllm_api_base', config.vllm.api_base)
-        vllm_api_key = settings.get('vllm_api_key', config.vllm.api_key)
-        vllm_model_name = settings.get('vllm_model_name', config.vllm.model_name)
-        aider_map_tokens = SettingsManager.get_int('aider_map_tokens', config.aider.map_tokens)
-        aider_no_repo_map = SettingsManager.get_bool('aider_no_repo_map', config.aider.no_repo_map)
-        aider_timeout = SettingsManager.get_int('aider_timeout', 600)
-        retry_count = SettingsManager.get_int('aider_retry_count', 1)
+        vllm_api_base = cfg.vllm_api_base
+        vllm_api_key = cfg.vllm_api_key
+        vllm_model_name = cfg.vllm_model_name
+        aider_map_tokens = cfg.aider_map_tokens
+        aider_timeout = cfg.aider_timeout
+        retry_count = cfg.aider_retry_count
         
         # 分批配置（新增）
-        aider_review_max_tokens = SettingsManager.get_int('aider_review_max_tokens', 100000)
+        aider_review_max_tokens = cfg.aider_review_max_tokens
         
         env = os.environ.copy()
         env["OPENAI_API_BASE"] = vllm_api_base
@@ -216,12 +311,8 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             batches = [valid_files]
             logger.info(f"总 token 数 {total_tokens}，无需分批")
         
-        # 更新批次总数到数据库
-        with get_db_session() as db:
-            record = db.query(ReviewRecord).filter(ReviewRecord.task_id == task_id).first()
-            if record:
-                record.batch_total = len(batches)
-                record.batch_current = 0
+        # 文件数、批次总数和首批进度一次写入数据库
+        _update_record(task_id, **files_values, batch_total=len(batches), batch_current=1)
         
         # 6. 多批次执行 Aider（保留 Repo Map 全仓库感知）
         batch_reports = []
@@ -230,13 +321,6 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
         for batch_idx, batch_files in enumerate(batches):
             logger.info(f"执行批次 {batch_idx + 1}/{len(batches)}: {len(batch_files)} 个文件")
             
-            # 更新当前批次进度
-            with get_db_session() as db:
-                record = db.query(ReviewRecord).filter(ReviewRecord.task_id == task_id).first()
-                if record:
-                    record.batch_current = batch_idx + 1
-
-            
             # 构造 Aider 命令
             cmd = [
                 "aider",
@@ -263,26 +347,22 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             
             for attempt in range(retry_count + 1):
                 try:
-                    result = subprocess.run(
-                        cmd,
-                        cwd=work_dir,
-                        env=env,
-                        capture_output=True,
-                        text=True,
-                        timeout=aider_timeout
-                    )
+                    result = _run_aider(cmd, work_dir, env, aider_timeout)
                     
                     if result.returncode == 0:
                         break
                     else:
-                        last_error = result.stderr
+                        # 输出已合并，错误信息通常在末尾
+                        last_error = result.stdout[-2000:]
                         # 记录详细错误信息用于诊断
                         logger.warning(f"批次 {batch_idx + 1} 失败 (尝试 {attempt + 1}/{retry_count + 1})")
                         logger.warning(f"returncode: {result.returncode}")
-                        logger.warning(f"stderr: {result.stderr[:500] if result.stderr else '(空)'}")
+                        logger.warning(f"output: {result.stdout[-500:] if result.stdout else '(空)'}")
                         if attempt < retry_count:
-                            logger.info(f"等待 2 秒后重试...")
-                            time.sleep(2)
+                            logger.info(f"等待 {_RETRY_DELAY} 秒后重试...")
+                            # 服务停止时立即结束等待，不再重试
+                            if _stopping.wait(_RETRY_DELAY):
+                                raise ReviewCancelled()
 
                         
                 except subprocess.TimeoutExpired:
@@ -296,8 +376,7 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
             
             # 解析批次输出
             if batch_success and result:
-                raw_output = result.stdout + result.stderr
-                batch_report = parse_aider_output(raw_output)
+                batch_report = parse_aider_output(result.stdout)
                 batch_status = 'success'
             else:
                 batch_report = f"⚠️ 批次 {batch_idx + 1} 执行失败: {last_error}"
@@ -314,11 +393,12 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
                 'preview': batch_report[:200] if batch_report else ''  # 预览前200字符
             })
             
-            # 更新批次结果到数据库
-            with get_db_session() as db:
-                record = db.query(ReviewRecord).filter(ReviewRecord.task_id == task_id).first()
-                if record:
-                    record.batch_results = json.dumps(batch_results_summary, ensure_ascii=False)
+            # 批次结果与下一批次进度一次写入数据库
+            _update_record(
+                task_id,
+                batch_results=json.dumps(batch_results_summary, ensure_ascii=False),
+                batch_current=min(batch_idx + 2, len(batches))
+            )
             
             if result and result.returncode != 0:
                 logger.warning(f"批次 {batch_idx + 1} 返回非零状态: {last_error}")
@@ -341,58 +421,144 @@ def run_aider_review(repo_url: str, branch: str, strategy: str, context: dict):
         
         # 9. 保存结果
         formatted_report = format_review_comment(review_report, strategy, context)
-        finalize_review(task_id, start_time, formatted_report, total_issues, critical, warning, suggestion, quality_score)
+        finalize_review(task_id, started, formatted_report, total_issues, critical, warning, suggestion, quality_score,
+                        issue_rows=_issue_rows(formatted_report), review_id=review_id)
         
         # 10. 回写评论（优先使用仓库级开关，fallback到全局配置）
-        enable_comment = context.get('enable_comment', SettingsManager.get_bool('enable_comment', True))
+        enable_comment = context.get('enable_comment', cfg.enable_comment)
         if enable_comment:
-            post_comment_to_git(context, formatted_report)
+            post_comment_to_git(context, formatted_report, settings)
         else:
             logger.info("评论回写已禁用，跳过")
         
         logger.info(f"任务 {task_id} 完成, 发现 {total_issues} 个问题")
         
+    except ReviewCancelled:
+        logger.warning(f"任务 {task_id} 因服务停止被取消")
+        finalize_review(task_id, started, None, 0, 0, 0, 0, error="服务停止，审查已取消", **record_values)
     except subprocess.TimeoutExpired:
         logger.error(f"任务 {task_id} 超时 (已用尽所有重试)")
-        finalize_review(task_id, start_time, None, 0, 0, 0, 0, error="任务超时")
-        enable_comment = context.get('enable_comment', SettingsManager.get_bool('enable_comment', True))
+        finalize_review(task_id, started, None, 0, 0, 0, 0, error="任务超时", **record_values)
+        enable_comment = context.get('enable_comment', cfg.enable_comment)
         if enable_comment:
-            post_comment_to_git(context, "⚠️ 代码审查超时，请稍后重试或减少变更文件数量。")
+            post_comment_to_git(context, "⚠️ 代码审查超时，请稍后重试或减少变更文件数量。", settings)
     except Exception as e:
         logger.exception(f"任务 {task_id} 执行失败: {e}")
-        finalize_review(task_id, start_time, None, 0, 0, 0, 0, error=str(e))
-        enable_comment = context.get('enable_comment', SettingsManager.get_bool('enable_comment', True))
+        finalize_review(task_id, started, None, 0, 0, 0, 0, error=str(e), **record_values)
+        enable_comment = context.get('enable_comment', cfg.enable_comment)
         if enable_comment:
-            post_comment_to_git(context, f"❌ 代码审查执行失败: {str(e)}")
+            post_comment_to_git(context, f"❌ 代码审查执行失败: {str(e)}", settings)
     finally:
+        if mirror_locked:
+            mirror_lock.release()
         if os.path.exists(work_dir):
             try:
-                shutil.rmtree(work_dir)
+                repo_cache.remove_worktree(repo_url, work_dir)
                 logger.info(f"清理工作目录: {work_dir}")
             except Exception as e:
                 logger.warning(f"清理工作目录失败: {e}")
 
 
-def finalize_review(task_id: str, start_time: datetime, report: Optional[str], 
+def _split_z(output: str) -> List[str]:
+    """拆分 git -z 输出（NUL 分隔，路径不做引号转义，非 ASCII 文件名原样保留）"""
+    return [p for p in output.split('\0') if p]
+
+
+def _run_aider(cmd: list, work_dir: str, env: dict, timeout: int) -> subprocess.CompletedProcess:
+    """
+    运行 Aider：stdout/stderr 合并写入临时文件，Python 侧不再边读管道边累积分块，
+    结束后读出末尾至多 _MAX_OUTPUT_BYTES 并解码，非法字节替换而不抛异常。
+    超时时杀死子进程并抛出 TimeoutExpired；服务停止时子进程被 terminate_running 终止，抛出 ReviewCancelled。
+    临时文件放在系统临时目录，不进入 worktree，避免被 Aider 当作未跟踪文件
+    """
+    with tempfile.TemporaryFile() as out:
+        with _procs_lock:
+            if _stopping.is_set():
+                raise ReviewCancelled()
+            proc = subprocess.Popen(cmd, cwd=work_dir, env=env, stdout=out, stderr=subprocess.STDOUT)
+            _procs.add(proc)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            with _procs_lock:
+                _procs.discard(proc)
+        if _stopping.is_set():
+            raise ReviewCancelled()
+        
+        size = os.fstat(out.fileno()).st_size
+        out.seek(max(0, size - _MAX_OUTPUT_BYTES))
+        stdout = out.read().decode('utf-8', errors='replace')
+    return subprocess.CompletedProcess(cmd, returncode, stdout)
+
+
+def terminate_running():
+    """终止所有运行中的 Aider 子进程（服务停止时调用），之后不再启动新的子进程"""
+    with _procs_lock:
+        _stopping.set()
+        procs = list(_procs)
+    for proc in procs:
+        proc.terminate()
+    if procs:
+        logger.info(f"已终止 {len(procs)} 个运行中的 Aider 进程")
+
+
+def finalize_review(task_id: str, started: float, report: Optional[str], 
                     issues: int, critical: int, warning: int, suggestion: int,
-                    quality_score: float = None, error: str = None):
-    """完成审查记录的更新"""
+                    quality_score: float = None, error: str = None,
+                    issue_rows: Optional[List[dict]] = None, review_id: Optional[int] = None, **extra):
+    """
+    完成审查记录的更新，started 为任务开始时的 time.monotonic()，extra 为需要一并写入的其他字段；
+    issue_rows 为问题详情，与记录更新在同一事务中批量写入（已知 review_id 时无需再查询主键）
+    """
     end_time = datetime.utcnow()
-    processing_time = (end_time - start_time).total_seconds()
+    processing_time = time.monotonic() - started
     
     with get_db_session() as db:
-        record = db.query(ReviewRecord).filter(ReviewRecord.task_id == task_id).first()
-        if record:
-            record.status = ReviewStatus.FAILED if error else ReviewStatus.COMPLETED
-            record.completed_at = end_time
-            record.processing_time_seconds = processing_time
-            record.report = report
-            record.issues_count = issues
-            record.critical_count = critical
-            record.warning_count = warning
-            record.suggestion_count = suggestion
-            record.quality_score = quality_score
-            record.error_message = error
+        db.execute(update(ReviewRecord).where(ReviewRecord.task_id == task_id).values(
+            status=ReviewStatus.FAILED if error else ReviewStatus.COMPLETED,
+            completed_at=end_time,
+            processing_time_seconds=processing_time,
+            report=report,
+            issues_count=issues,
+            critical_count=critical,
+            warning_count=warning,
+            suggestion_count=suggestion,
+            quality_score=quality_score,
+            error_message=error,
+            **extra
+        ))
+        if issue_rows:
+            if review_id is None:
+                review_id = db.execute(select(ReviewRecord.id).where(ReviewRecord.task_id == task_id)).scalar()
+            if review_id is not None:
+                bulk_insert_issues(db, review_id, issue_rows)
+    bump_data_version()
+
+
+def _issue_rows(report: str) -> List[dict]:
+    """解析报告中的问题，转换为 ReviewIssue 列字典（供热点文件、问题分类统计使用）"""
+    return [
+        {
+            'severity': IssueSeverity(issue.severity.value),
+            'file_path': issue.file_path[:500] if issue.file_path else None,
+            'line_number': issue.line_number,
+            'title': (issue.title or '')[:500],
+            'description': issue.description,
+            'suggestion': issue.suggestion,
+            'category': issue.category[:100] if issue.category else None,
+        }
+        for issue in issue_parser.parse_report(report)
+    ]
+
+
+def _update_record(task_id: str, **values):
+    """按 task_id 直接更新审查记录（单条 UPDATE，无需先 SELECT）"""
+    with get_db_session() as db:
+        db.execute(update(ReviewRecord).where(ReviewRecord.task_id == task_id).values(**values))
 
 
 def analyze_issues(report: str) -> tuple:
@@ -400,9 +566,9 @@ def analyze_issues(report: str) -> tuple:
     if not report:
         return 0, 0, 0
     
-    # 简单的问题识别逻辑，基于关键词
-    critical = len(re.findall(r'🔴|严重|critical|error|security|漏洞|危险', report, re.IGNORECASE))
-    warning = len(re.findall(r'🟡|警告|warning|注意|问题', report, re.IGNORECASE))
-    suggestion = len(re.findall(r'🔵|建议|suggestion|优化|改进|recommend', report, re.IGNORECASE))
+    # 简单的问题识别逻辑，基于关键词（三类关键词互不重叠，单次扫描计数）
+    counts = {'c': 0, 'w': 0, 's': 0}
+    for m in _ISSUE_RE.finditer(report):
+        counts[m.lastgroup] += 1
     
-    return critical, warning, suggestion
+    return counts['c'], counts['w'], counts['s']
@@ -0,0 +1,204 @@
+"""
+审查任务队列
+
+审查任务（克隆 + Aider 子进程 + 评论回写）耗时较长，统一提交到有界线程池执行，
+Web 请求和轮询线程提交后立即返回，不再被单个审查阻塞；
+等待中的任务数有上限，突发请求超出时直接拒绝，避免积压无限增长；
+同一 MR / Commit 的重复触发在入队前合并，刚审查完的 Commit 在一段时间内不再重复审查；
+同一仓库分支连续推送的多个 Commit 在排队期间合并为一次审查
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from config import config
+from utils import logger
+
+_max_workers = max(1, config.server.max_review_workers)
+_executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="review")
+
+# 执行中 + 等待中的任务上限
+_capacity = _max_workers + max(0, config.server.review_queue_size)
+# 单次合并审查的最大 Commit 数
+_batch_size = max(1, config.server.review_batch_size)
+# cancel() 会同步执行完成回调，回调内需再次加锁，因此使用可重入锁
+_lock = threading.RLock()
+_active = 0
+_running = 0
+# 累计计数（队列监控用）
+_counters = {"submitted": 0, "rejected": 0, "coalesced": 0, "batched": 0, "completed": 0, "failed": 0}
+# 去重键 -> 最近一次提交的任务
+_pending: Dict[Tuple, Future] = {}
+# 已完成的 Commit 去重键 -> 过期时间（monotonic），拦截迟到的重复触发
+_recent: Dict[Tuple, float] = {}
+RECENT_TTL = 300
+# (仓库地址, 分支) -> 尚未开始执行、可继续合并 Commit 的任务
+_batches: Dict[Tuple, Future] = {}
+
+
+class QueueFullError(Exception):
+    """审查队列已满"""
+
+
+def _execute(batch_key: Optional[Tuple], fn, *args):
+    """在工作线程中执行审查任务，记录执行中的任务数；开始执行后不再接受合并"""
+    global _running
+    context = args[-1]
+    with _lock:
+        _running += 1
+        batch = _batches.get(batch_key)
+        if batch is not None and batch.review_context is context:
+            del _batches[batch_key]
+    try:
+        return fn(*args)
+    finally:
+        with _lock:
+            _running -= 1
+
+
+def _task_key(context: dict) -> Tuple:
+    """去重键：(平台, 项目, MR 编号或 Commit)"""
+    if context.get('strategy') == 'merge_request':
+        ref = ('mr', context.get('mr_iid'))
+    else:
+        ref = ('commit', context.get('commit_id'))
+    return (context.get('platform'), context.get('project_id'), *ref)
+
+
+def _concrete_commit(key: Tuple) -> bool:
+    """是否为具体的 Commit；手动触发的 HEAD 每次都需重新审查，不参与记录与合并"""
+    return key[2] == 'commit' and key[3] not in (None, '', 'HEAD')
+
+
+def _remember(key: Tuple):
+    """记录刚完成的 Commit 审查"""
+    if not _concrete_commit(key):
+        return
+    now = time.monotonic()
+    for k in [k for k, expires in _recent.items() if expires <= now]:
+        del _recent[k]
+    _recent[key] = now + RECENT_TTL
+
+
+def _on_done(future: Future):
+    """释放队列名额，并记录未被 run_aider_review 捕获的异常"""
+    global _active
+    with _lock:
+        _active -= 1
+        keys = getattr(future, 'review_keys', ())
+        for key in keys:
+            if _pending.get(key) is future:
+                del _pending[key]
+        batch_key = getattr(future, 'batch_key', None)
+        if _batches.get(batch_key) is future:
+            del _batches[batch_key]
+        if future.cancelled():
+            return
+        exc = future.exception()
+        _counters["failed" if exc is not None else "completed"] += 1
+        if exc is None:
+            for key in keys:
+                _remember(key)
+    if exc is not None:
+        logger.error(f"审查任务异常退出: {exc}", exc_info=exc)
+
+
+def _merge_into_batch(batch_key: Tuple, key: Tuple, context: dict) -> Optional[Future]:
+    """把 Commit 并入同一仓库分支排队中的任务，返回该任务；无可合并任务时返回 None（调用方持有 _lock）"""
+    batch = _batches.get(batch_key)
+    if batch is None:
+        return None
+    batch_context = batch.review_context
+    commit_ids = batch_context.setdefault('batch_commit_ids', [batch_context['commit_id']])
+    if len(commit_ids) >= _batch_size:
+        return None
+    # 任务尚未开始执行（开始时会从 _batches 移除），此时修改其 context 是安全的
+    commit_ids.append(context['commit_id'])
+    batch.review_keys.append(key)
+    _pending[key] = batch
+    _counters["batched"] += 1
+    logger.info(f"Commit {context['commit_id'][:8]} 并入排队中的审查任务（共 {len(commit_ids)} 个提交）")
+    return batch
+
+
+def submit_review(repo_url: str, branch: str, strategy: str, context: dict) -> Future:
+    """
+    提交审查任务到线程池，参数同 run_aider_review；队列已满时抛出 QueueFullError
+
+    同一去重键已有任务时：MR 尚在排队则取消旧任务改为执行新任务（同一 MR 连续推送只审查最新的），
+    已在执行则照常提交新任务以覆盖新推送；Commit 已在排队或执行中直接复用，不重复提交；
+    RECENT_TTL 秒内已审查完成的 Commit 直接返回已完成的 Future；
+    同一仓库分支已有排队中的 Commit 审查时，新的 Commit 并入该任务一起审查（至多 REVIEW_BATCH_SIZE 个）
+    """
+    global _active
+    from services.review import run_aider_review
+
+    key = _task_key(context)
+    batch_key = (repo_url, branch) if strategy == 'commit' and _concrete_commit(key) else None
+    with _lock:
+        previous = _pending.get(key)
+        if previous is not None and not previous.done():
+            if key[2] == 'commit':
+                _counters["coalesced"] += 1
+                logger.info(f"相同的审查任务已在队列中，忽略重复请求: {key}")
+                return previous
+            if previous.cancel():
+                _counters["coalesced"] += 1
+                logger.info(f"合并重复的审查请求: {key}")
+
+        if _recent.get(key, 0) > time.monotonic():
+            _counters["coalesced"] += 1
+            logger.info(f"该 Commit 刚审查完成，忽略重复请求: {key}")
+            done = Future()
+            done.set_result(None)
+            return done
+
+        if batch_key is not None:
+            batch = _merge_into_batch(batch_key, key, context)
+            if batch is not None:
+                return batch
+
+        if _active >= _capacity:
+            _counters["rejected"] += 1
+            raise QueueFullError(f"审查队列已满（{_capacity} 个任务）")
+        _active += 1
+
+        try:
+            future = _executor.submit(_execute, batch_key, run_aider_review, repo_url, branch, strategy, context)
+        except Exception:
+            _active -= 1
+            raise
+        _counters["submitted"] += 1
+        future.review_keys = [key]
+        future.review_context = context
+        future.batch_key = batch_key
+        _pending[key] = future
+        # 任务可能已被空闲线程取走并开始执行，此时不再接受合并
+        if batch_key is not None and not future.running() and not future.done():
+            _batches[batch_key] = future
+    future.add_done_callback(_on_done)
+    return future
+
+
+def get_stats() -> dict:
+    """队列状态：执行中、排队中的任务数、容量与累计计数"""
+    with _lock:
+        return {
+            "workers": _max_workers,
+            "capacity": _capacity,
+            "running": _running,
+            "queued": _active - _running,
+            **_counters,
+        }
+
+
+def shutdown(wait: bool = False):
+    """关闭审查线程池（服务停止时调用），未开始的任务直接取消，运行中的 Aider 进程被终止"""
+    from services.review import terminate_running
+    
+    _executor.shutdown(wait=False, cancel_futures=True)
+    terminate_running()
+    if wait:
+        _executor.shutdown(wait=True)
+    logger.info("审查任务线程池已关闭")
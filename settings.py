@@ -2,11 +2,15 @@
 动态配置管理模块
 支持通过数据库存储配置，实现运行时修改、实时生效
 """
+import threading
+import time
+from dataclasses import dataclass, field
 from typing import Dict, Optional
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from config import config
 # 复用database模块的引擎，避免重复创建连接
 from database import engine
 
@@ -47,19 +51,73 @@ DEFAULT_SETTINGS = {
     "aider_no_repo_map": {"value": "false", "category": "aider", "description": "是否禁用RepoMap"},
     "aider_timeout": {"value": "600", "category": "aider", "description": "Aider执行超时时间(秒)"},
     "aider_retry_count": {"value": "1", "category": "aider", "description": "失败重试次数"},
-    
-    # 轮询配置
-    "polling_repos": {"value": "[]", "category": "polling", "description": "轮询仓库列表(JSON)"},
 }
 
 
+def _to_bool(value: Optional[str], default: bool) -> bool:
+    if value is None:
+        return default
+    return value.lower() in ("true", "1", "yes", "on")
+
+
+def _to_int(value: Optional[str], default: int) -> int:
+    try:
+        return int(value) if value is not None else default
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True, slots=True)
+class ReviewSettings:
+    """审查任务使用的配置快照（已解析类型），由 SettingsManager.snapshot() 构建"""
+    git_http_user: str = ""
+    git_http_password: str = ""
+    git_token: str = ""
+    git_server_url: str = ""
+    enable_comment: bool = True
+    vllm_api_base: str = ""
+    vllm_api_key: str = ""
+    vllm_model_name: str = ""
+    aider_map_tokens: int = 0
+    aider_no_repo_map: bool = False
+    aider_timeout: int = 600
+    aider_retry_count: int = 1
+    aider_review_max_tokens: int = 100000
+    # 原始配置字典（评论回写等按键读取的模块使用，只读）
+    raw: Dict[str, str] = field(default_factory=dict, repr=False)
+    
+    @classmethod
+    def from_dict(cls, settings: Dict[str, str]) -> "ReviewSettings":
+        """从配置字典解析，缺失或无效的值使用默认配置"""
+        get = settings.get
+        return cls(
+            git_http_user=get("git_http_user", ""),
+            git_http_password=get("git_http_password", ""),
+            git_token=get("git_token", ""),
+            git_server_url=get("git_server_url", ""),
+            enable_comment=_to_bool(get("enable_comment"), True),
+            vllm_api_base=get("vllm_api_base", config.vllm.api_base),
+            vllm_api_key=get("vllm_api_key", config.vllm.api_key),
+            vllm_model_name=get("vllm_model_name", config.vllm.model_name),
+            aider_map_tokens=_to_int(get("aider_map_tokens"), config.aider.map_tokens),
+            aider_no_repo_map=_to_bool(get("aider_no_repo_map"), config.aider.no_repo_map),
+            aider_timeout=_to_int(get("aider_timeout"), 600),
+            aider_retry_count=_to_int(get("aider_retry_count"), 1),
+            aider_review_max_tokens=_to_int(get("aider_review_max_tokens"), 100000),
+            raw=settings,
+        )
+
+
 class SettingsManager:
     """动态配置管理器"""
     
     _session_factory = None
     _cache: Dict[str, str] = {}
-    _cache_time: Optional[datetime] = None
+    _cache_time: Optional[float] = None  # time.monotonic() 加载时刻
     _cache_ttl = 5  # 缓存5秒
+    _cache_lock = threading.Lock()
+    _version = 0    # 配置版本号，每次写入后递增
+    _snapshot: Optional[ReviewSettings] = None  # 基于当前缓存字典解析的快照
     
     @classmethod
     def _get_session(cls):
@@ -87,45 +145,72 @@ class SettingsManager:
             session.commit()
         finally:
             session.close()
+        # 启动前已读取的缓存可能缺少刚写入的默认值，清除缓存并递增版本号
+        with cls._cache_lock:
+            cls._cache_time = None
+            cls._version += 1
     
     @classmethod
-    def get(cls, key: str, default: str = "") -> str:
-        """获取单个配置值"""
-        all_settings = cls.get_all()
-        return all_settings.get(key, default)
+    def get(cls, key: str, default: str = "", settings: Optional[Dict[str, str]] = None) -> str:
+        """获取单个配置值，传入 settings 快照时直接从快照读取"""
+        if settings is None:
+            settings = cls._cached()
+        return settings.get(key, default)
     
     @classmethod
-    def get_bool(cls, key: str, default: bool = False) -> bool:
+    def get_bool(cls, key: str, default: bool = False, settings: Optional[Dict[str, str]] = None) -> bool:
         """获取布尔类型配置"""
-        value = cls.get(key, str(default).lower())
+        value = cls.get(key, str(default).lower(), settings)
         return value.lower() in ("true", "1", "yes", "on")
     
     @classmethod
-    def get_int(cls, key: str, default: int = 0) -> int:
+    def get_int(cls, key: str, default: int = 0, settings: Optional[Dict[str, str]] = None) -> int:
         """获取整数类型配置"""
         try:
-            return int(cls.get(key, str(default)))
+            return int(cls.get(key, str(default), settings))
         except ValueError:
             return default
     
     @classmethod
-    def get_all(cls) -> Dict[str, str]:
-        """获取所有配置（带缓存）"""
-        now = datetime.utcnow()
+    def _cached(cls) -> Dict[str, str]:
+        """返回缓存字典本身（只读使用，不拷贝），过期时重新加载"""
+        cache_time = cls._cache_time
+        if cache_time is not None and time.monotonic() - cache_time < cls._cache_ttl:
+            return cls._cache
         
-        # 检查缓存是否有效
-        if cls._cache_time and (now - cls._cache_time).total_seconds() < cls._cache_ttl:
-            return cls._cache.copy()
-        
-        # 重新加载
-        session = cls._get_session()
-        try:
-            settings = session.query(SystemSetting).all()
-            cls._cache = {s.key: s.value or "" for s in settings}
-            cls._cache_time = now
-            return cls._cache.copy()
-        finally:
-            session.close()
+        # 加锁重新加载，并发的缓存未命中只查询一次数据库
+        with cls._cache_lock:
+            cache_time = cls._cache_time
+            if cache_time is not None and time.monotonic() - cache_time < cls._cache_ttl:
+                return cls._cache
+            
+            session = cls._get_session()
+            try:
+                settings = session.query(SystemSetting).all()
+                cls._cache = {s.key: s.value or "" for s in settings}
+                cls._cache_time = time.monotonic()
+                return cls._cache
+            finally:
+                session.close()
+    
+    @classmethod
+    def get_all(cls) -> Dict[str, str]:
+        """获取所有配置（带缓存，返回副本）"""
+        return cls._cached().copy()
+    
+    @classmethod
+    def snapshot(cls) -> ReviewSettings:
+        """获取已解析的审查配置快照，缓存未重新加载时复用同一对象"""
+        settings = cls._cached()
+        snap = cls._snapshot
+        if snap is None or snap.raw is not settings:
+            snap = cls._snapshot = ReviewSettings.from_dict(settings)
+        return snap
+    
+    @classmethod
+    def get_version(cls) -> int:
+        """获取配置版本号（本进程内每次写入配置后递增）"""
+        return cls._version
     
     @classmethod
     def get_all_with_meta(cls) -> list:
@@ -167,8 +252,10 @@ class SettingsManager:
                 session.add(setting)
             session.commit()
             
-            # 清除缓存
-            cls._cache_time = None
+            # 清除缓存（等待进行中的重新加载结束，避免旧数据覆盖），并递增版本号通知持有配置快照的模块
+            with cls._cache_lock:
+                cls._cache_time = None
+                cls._version += 1
             return True
         except Exception:
             session.rollback()
@@ -197,15 +284,13 @@ class SettingsManager:
                     session.add(setting)
             session.commit()
             
-            # 清除缓存
-            cls._cache_time = None
+            # 清除缓存（等待进行中的重新加载结束，避免旧数据覆盖），并递增版本号通知持有配置快照的模块
+            with cls._cache_lock:
+                cls._cache_time = None
+                cls._version += 1
             return True
         except Exception:
             session.rollback()
             return False
         finally:
             session.close()
-
-
-# 初始化默认配置
-SettingsManager.init_defaults()
@@ -477,12 +477,13 @@ async function showReviewDetail(taskId) {
             ${data.files_reviewed ? `
             <div class="review-files-section">
                 <div class="section-header collapsed" onclick="toggleSection(this)">
-                    <h4>📂 审查文件 (${JSON.parse(data.files_reviewed || '[]').length})</h4>
+                    <h4>📂 审查文件 (${data.files_count || data.files_reviewed.length})</h4>
                     <span class="toggle-icon">▶</span>
                 </div>
                 <div class="section-content" style="display: none;">
                     <ul class="file-list">
-                        ${JSON.parse(data.files_reviewed || '[]').map(f => `<li><code>${f}</code></li>`).join('')}
+                        ${data.files_reviewed.map(f => `<li><code>${f}</code></li>`).join('')}
+                        ${data.files_count > data.files_reviewed.length ? `<li>… 另有 ${data.files_count - data.files_reviewed.length} 个文件未列出</li>` : ''}
                     </ul>
                 </div>
             </div>
@@ -9,6 +9,20 @@ from sqlalchemy.orm import Session
 
 from models import ReviewRecord, ReviewIssue, ReviewStatus, ReviewStrategy, IssueSeverity
 
+# 审查数据版本号：审查记录创建或完成后递增，统计接口据此判断缓存的聚合结果是否失效
+_data_version = 0
+
+
+def bump_data_version():
+    """审查数据已变更"""
+    global _data_version
+    _data_version += 1
+
+
+def get_data_version() -> int:
+    """获取审查数据版本号"""
+    return _data_version
+
 
 class StatisticsService:
     """统计服务"""
@@ -315,7 +329,7 @@ class StatisticsService:
             ReviewIssue.file_path,
             func.count(ReviewIssue.id).label('issue_count'),
             func.sum(
-                func.case(
+                case(
                     (ReviewIssue.severity == IssueSeverity.CRITICAL, 1),
                     else_=0
                 )
@@ -0,0 +1,18 @@
+"""
+测试公共夹具
+"""
+import os
+import sys
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """建表（服务中由 lifespan 完成，导入模块本身不访问数据库）"""
+    from database import init_database
+
+    init_database()
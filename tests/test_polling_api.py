@@ -9,6 +9,7 @@ from unittest.mock import patch, MagicMock
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import review_server
 from review_server import app
 from polling import polling_manager, PollingRepo
 
@@ -86,5 +87,16 @@ def test_delete_repo_api():
     
     assert polling_manager.get_repo("del-1") is None
 
+def test_rate_limit_exempts_health():
+    """超出限额返回 429，健康检查不计数，仅前缀相同的路径照常计数"""
+    with patch.object(review_server, "RATE_LIMIT", 1), patch.dict(review_server.request_counts, clear=True):
+        assert client.get("/health").status_code == 200
+        assert client.get("/api/polling/queue").status_code == 200
+        response = client.get("/api/polling/queue")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.get("/health").status_code == 200
+        assert client.get("/healthXYZ").status_code == 429
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
@@ -108,5 +108,284 @@ def test_polling_loop_per_repo_timing(mock_check):
         args, _ = mock_check.call_args
         assert args[0].id == "r1"
 
+def test_check_repo_safe_records_time_and_swallows_errors():
+    """测试线程池中的仓库检查：成功记录轮询时间，异常不外抛"""
+    pm = PollingManager()
+    pm._running = True
+    repo = PollingRepo(id="safe1", name="S1", url="U1")
+    pm._repos = {repo.id: repo}
+    pm._publish_view()
+    
+    with patch.object(pm, '_check_repo') as mock_check:
+        pm._check_repo_safe(repo, 123.0, "2024-01-01T00:00:00")
+        mock_check.assert_called_once_with(repo, "2024-01-01T00:00:00")
+    assert repo._last_poll_ts == 123.0
+    
+    with patch.object(pm, '_check_repo', side_effect=RuntimeError("boom")):
+        pm._check_repo_safe(repo, 456.0)
+        pm._check_repo_safe(repo, 789.0)
+    # 失败也记录时间，并按失败次数指数退避
+    assert repo._last_poll_ts == 789.0
+    assert repo._backoff == 4
+    
+    # 已被删除的仓库对象不再检查
+    pm._repos = {}
+    pm._publish_view()
+    with patch.object(pm, '_check_repo') as mock_check:
+        pm._check_repo_safe(repo, 999.0)
+        mock_check.assert_not_called()
+
+def test_get_new_mrs_skips_unchanged_refs():
+    """测试MR refs未变化时跳过解析"""
+    pm = PollingManager()
+    repo = PollingRepo(id="etag1", name="E1", url="U1", platform="gitlab", last_mr_id=1)
+    pm._repos = {repo.id: repo}
+    pm._etags.pop("etag1:mrs", None)
+    stdout = b"a" * 40 + b"\trefs/merge-requests/2/head\n"
+    
+    with patch('subprocess.run', return_value=MagicMock(returncode=0, stdout=stdout, stderr=b"")):
+        first = pm._get_new_mrs_git(repo, settings={})
+        second = pm._get_new_mrs_git(repo, settings={})
+    
+    assert [mr['iid'] for mr in first] == [2]
+    assert second == []
+
+
+def test_repo_rows_persist_across_managers():
+    """测试仓库配置按行写入 polling_repos 表并可被新实例加载"""
+    pm = PollingManager()
+    repo = PollingRepo(id="persist-1", name="P1", url="git@host:o/p.git", polling_interval=42)
+    pm.add_repo(repo)
+    try:
+        repo.last_commit_id = "abc123"
+        pm._dirty_ids.add(repo.id)
+        pm._save_repos()
+        assert not pm._dirty_ids
+        
+        loaded = PollingManager()
+        loaded.load()
+        loaded = loaded.get_repo_obj("persist-1")
+        assert loaded is not None
+        assert loaded.polling_interval == 42
+        assert loaded.last_commit_id == "abc123"
+    finally:
+        pm.remove_repo("persist-1")
+    reloaded = PollingManager()
+    reloaded.load()
+    assert reloaded.get_repo_obj("persist-1") is None
+
+def test_stop_wakes_polling_loop_immediately():
+    """测试 stop() 立即唤醒等待中的轮询线程"""
+    pm = PollingManager()
+    pm._repos = {}
+    pm._enabled_ids = set()
+    pm._publish_view()
+    pm.start()
+    time.sleep(0.1)
+    
+    start = time.time()
+    pm.stop()
+    assert not pm._thread.is_alive()
+    assert time.time() - start < 1
+
+@patch('polling.PollingManager._check_repo')
+def test_add_repo_wakes_polling_loop(mock_check):
+    """测试新增仓库后轮询线程立即检查，无需等待扫描周期"""
+    pm = PollingManager()
+    pm._repos = {}
+    pm._enabled_ids = set()
+    pm._publish_view()
+    pm.start()
+    try:
+        time.sleep(0.1)
+        repo = PollingRepo(id="wake-1", name="W1", url="U1")
+        with patch.object(pm, '_save_repo'):
+            pm.add_repo(repo)
+            deadline = time.time() + 2
+            while not mock_check.called and time.time() < deadline:
+                time.sleep(0.02)
+        assert mock_check.called
+    finally:
+        pm.stop()
+
+def test_enabled_index_follows_updates():
+    """测试已启用仓库索引随增删改同步"""
+    pm = PollingManager()
+    repo = PollingRepo(id="idx-1", name="I1", url="U1")
+    with patch.object(pm, '_save_repo'), patch.object(pm, '_delete_repo_row'):
+        pm.add_repo(repo)
+        assert "idx-1" in pm._enabled_ids
+        assert pm.get_repo_obj("idx-1") is repo
+        assert repo in pm._enabled_view
+        
+        pm.update_repo("idx-1", {"enabled": False})
+        assert "idx-1" not in pm._enabled_ids
+        assert not any(r.id == "idx-1" for r in pm._enabled_view)
+        
+        pm.update_repo("idx-1", {"enabled": True, "polling_interval": 3})
+        assert "idx-1" in pm._enabled_ids
+        repo = pm.get_repo_obj("idx-1")
+        assert repo in pm._enabled_view
+        assert repo._interval_seconds == 180
+        
+        # 运行时状态字段不能通过更新接口写入
+        pm.update_repo("idx-1", {"_last_poll_ts": "x", "_backoff": "x", "_interval_seconds": "x"})
+        repo = pm.get_repo_obj("idx-1")
+        assert repo._last_poll_ts == 0
+        assert repo._backoff == 1
+        assert repo._interval_seconds == 180
+        
+        pm.remove_repo("idx-1")
+        assert "idx-1" not in pm._enabled_ids
+        assert pm.get_repo_obj("idx-1") is None
+
+def test_repo_writes_run_outside_lock():
+    """测试更新、删除仓库时数据库写入不持有 _repos_lock"""
+    pm = PollingManager()
+    held = []
+    record = lambda *args: held.append(pm._repos_lock._is_owned())
+    with patch('polling.get_db_session', side_effect=lambda: record() or MagicMock()):
+        pm.add_repo(PollingRepo(id="lock1", name="L1", url="U1"))
+        pm.update_repo("lock1", {"branch": "dev"})
+        pm.remove_repo("lock1")
+    assert held == [False, False, False]
+
+def test_update_repo_discards_stale_check_results():
+    """测试更新配置后，基于旧对象进行中的检查不再写回状态、摘要和退避"""
+    pm = PollingManager()
+    pm._running = True
+    repo = PollingRepo(id="stale1", name="S1", url="U1", poll_mrs=True, last_commit_id="old", last_mr_id=5)
+    stdout = b"f" * 40 + b"\trefs/heads/main\n" + b"a" * 40 + b"\trefs/merge-requests/9/head\n"
+    
+    def check_then_update(*args, **kwargs):
+        # ls-remote 返回后、写回结果前，用户重置了仓库状态
+        pm.update_repo("stale1", {"last_commit_id": "", "last_mr_id": 0})
+        return MagicMock(returncode=0, stdout=stdout, stderr=b"")
+    
+    with patch.object(pm, '_save_repo'):
+        pm.add_repo(repo)
+        with patch('subprocess.run', side_effect=check_then_update), \
+             patch.object(pm, '_trigger_review'), patch.object(pm, '_mark_dirty'):
+            pm._check_repo_safe(repo, 100.0)
+    
+    current = pm.get_repo_obj("stale1")
+    assert current is not repo
+    assert current.last_commit_id == "" and current.last_mr_id == 0
+    assert current._last_poll_ts == 0 and current._backoff == 1
+    assert "stale1:mrs" not in pm._etags
+    # 读取方看到的是整体替换的新对象，旧对象保持原样
+    assert repo.last_commit_id == "old"
+
+def test_check_repo_uses_single_ls_remote():
+    """测试一次 ls-remote 同时获取分支HEAD和MR refs"""
+    pm = PollingManager()
+    pm._review_callback = MagicMock()
+    repo = PollingRepo(id="fused1", name="F1", url="U1", branch="main", platform="gitlab",
+                       poll_commits=True, poll_mrs=True, last_commit_id="old", last_mr_id=1)
+    pm._repos = {repo.id: repo}
+    pm._publish_view()
+    pm._etags.pop("fused1:mrs", None)
+    stdout = (b"b" * 40 + b"\trefs/heads/main\n"
+              + b"c" * 40 + b"\trefs/merge-requests/3/head\n")
+    
+    with patch('subprocess.run', return_value=MagicMock(returncode=0, stdout=stdout, stderr=b"")) as mock_run, \
+         patch.object(pm, '_trigger_review') as mock_trigger:
+        pm._check_repo(repo)
+    
+    assert mock_run.call_count == 1
+    cmd = mock_run.call_args[0][0]
+    assert 'refs/heads/main' in cmd and 'refs/merge-requests/*/head' in cmd
+    assert repo.last_commit_id == "b" * 40
+    assert repo.last_mr_id == 3
+    assert mock_trigger.call_count == 2
+    
+    # ls-remote 失败时退避（每次检查只记录一次失败），成功后恢复
+    pm._running = True
+    with patch('subprocess.run', return_value=MagicMock(returncode=128, stdout=b"", stderr=b"fatal")):
+        assert pm._check_repo(repo) is False
+        pm._check_repo_safe(repo, 1.0)
+    assert repo._backoff == 2
+    with patch('subprocess.run', return_value=MagicMock(returncode=128, stdout=b"", stderr=b"fatal")), \
+         patch.object(pm, '_mark_dirty', side_effect=RuntimeError("boom")):
+        pm._check_repo_safe(repo, 2.0)
+    assert repo._backoff == 4
+    with patch('subprocess.run', return_value=MagicMock(returncode=0, stdout=stdout, stderr=b"")), \
+         patch.object(pm, '_trigger_review'):
+        pm._check_repo_safe(repo, 3.0)
+    assert repo._backoff == 1
+
+
+def test_auth_url_cached_until_auth_fields_change():
+    """测试认证URL按认证字段缓存"""
+    pm = PollingManager()
+    repo = PollingRepo(id="auth1", name="A1", url="https://git.example.com/o/p.git",
+                       auth_type="token", token="t1")
+    settings = {"git_server_url": ""}
+    
+    with patch('polling.convert_to_http_auth_url', side_effect=lambda url, **kw: f"{url}#{kw.get('token')}") as mock_convert:
+        assert pm._get_auth_url(repo, settings).endswith("#t1")
+        assert pm._get_auth_url(repo, settings).endswith("#t1")
+        assert mock_convert.call_count == 1
+        
+        repo.token = "t2"
+        assert pm._get_auth_url(repo, settings).endswith("#t2")
+        assert mock_convert.call_count == 2
+
+
+def test_settings_snapshot_refreshes_on_version_change():
+    """测试配置快照仅在版本号变化时重新加载"""
+    pm = PollingManager()
+    with patch('polling.SettingsManager') as mock_sm:
+        mock_sm.get_version.return_value = 1
+        mock_sm.get_all.return_value = {"git_server_url": "a"}
+        assert pm._get_settings()["git_server_url"] == "a"
+        pm._get_settings()
+        assert mock_sm.get_all.call_count == 1
+        
+        mock_sm.get_version.return_value = 2
+        mock_sm.get_all.return_value = {"git_server_url": "b"}
+        assert pm._get_settings()["git_server_url"] == "b"
+        assert mock_sm.get_all.call_count == 2
+
+
+def test_mark_dirty_coalesces_writes():
+    """测试合并写入线程将窗口内的多次变更合并为一次落库"""
+    pm = PollingManager()
+    pm._repos = {"c1": PollingRepo(id="c1", name="C1", url="U1"),
+                 "c2": PollingRepo(id="c2", name="C2", url="U2")}
+    pm._enabled_ids = set()
+    pm._publish_view()
+    pm._FLUSH_INTERVAL = 0.2
+    
+    with patch.object(pm, '_save_repos', wraps=pm._save_repos) as mock_save, \
+         patch('polling.get_db_session'):
+        pm.start()
+        try:
+            pm._mark_dirty("c1")
+            pm._mark_dirty("c2")
+            time.sleep(0.6)
+            assert mock_save.call_count == 1
+            assert not pm._dirty_ids
+        finally:
+            pm.stop()
+
+
+def test_get_new_mrs_first_poll_returns_only_latest():
+    """测试首次轮询只返回最大MR，后续按ID降序返回全部新MR"""
+    pm = PollingManager()
+    repo = PollingRepo(id="mrmax1", name="M1", url="U1", platform="github", last_mr_id=0)
+    pm._repos = {repo.id: repo}
+    mr_text = b"".join(b"e" * 40 + b"\trefs/pull/%d/head\n" % i for i in (10, 2, 7))
+    
+    first = pm._get_new_mrs_git(repo, refs={'branch_sha': None, 'mr_text': mr_text})
+    assert [mr['iid'] for mr in first] == [10]
+    
+    repo.last_mr_id = 1
+    pm._etags.pop("mrmax1:mrs", None)
+    later = pm._get_new_mrs_git(repo, refs={'branch_sha': None, 'mr_text': mr_text})
+    assert [mr['iid'] for mr in later] == [10, 7, 2]
+    assert later[0]['source_ref'] == "refs/pull/10/head"
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
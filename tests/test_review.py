@@ -0,0 +1,72 @@
+"""
+审查任务流程测试
+"""
+import os
+import sys
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+from services import review
+
+
+def _memory_db():
+    """内存数据库及其会话上下文（替换 get_db_session）"""
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    @contextmanager
+    def session():
+        db = Session()
+        try:
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
+    return Session, session
+
+
+def test_run_aider_review_records_failure():
+    """审查记录以 Core INSERT 创建，检出失败时记录为失败状态"""
+    Session, session = _memory_db()
+    context = {"strategy": "commit", "commit_id": "abc", "platform": "gitlab", "enable_comment": False}
+    with patch.object(review, "get_db_session", session), \
+            patch.object(review.repo_cache, "checkout_worktree", side_effect=RuntimeError("clone failed")):
+        review.run_aider_review("http://git/g/p.git", "main", "commit", context)
+
+    db = Session()
+    record = db.query(models.ReviewRecord).one()
+    assert record.status == models.ReviewStatus.FAILED
+    assert record.error_message == "clone failed"
+    assert record.commit_id == "abc"
+    assert record.created_at is not None
+    db.close()
+
+
+def test_batched_review_targets_newest_reviewed_commit():
+    """合并审查的评论和记录落在最新的已审查 Commit 上，生效时间之前的 Commit 不再出现"""
+    Session, session = _memory_db()
+    times = {"c1": "2024-01-01T00:00:00+00:00", "c2": "2024-03-01T00:00:00+00:00", "c3": "2024-03-02T00:00:00+00:00"}
+    context = {"strategy": "commit", "commit_id": "c1", "batch_commit_ids": ["c1", "c2", "c3"],
+               "platform": "gitlab", "enable_comment": True, "effective_time": "2024-02-01T00:00:00Z"}
+    with patch.object(review, "get_db_session", session), \
+            patch.object(review.repo_cache, "checkout_worktree", return_value=MagicMock()), \
+            patch.object(review, "_commit_changes", side_effect=lambda repo, branch, cid: (times[cid], ["README"])), \
+            patch.object(review, "post_comment_to_git") as post_comment:
+        review.run_aider_review("http://git/g/batch.git", "main", "commit", context)
+
+    assert post_comment.call_args[0][0]["commit_id"] == "c3"
+    assert context["reviewed_commit_ids"] == ["c2", "c3"]
+    db = Session()
+    record = db.query(models.ReviewRecord).one()
+    assert record.commit_id == "c3"
+    assert record.files_count == 0
+    db.close()
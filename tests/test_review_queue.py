@@ -0,0 +1,195 @@
+"""
+审查任务队列测试
+"""
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import review, review_queue
+
+
+def _reset_queue():
+    """清空去重、合并、最近完成记录和累计计数"""
+    with review_queue._lock:
+        review_queue._pending.clear()
+        review_queue._recent.clear()
+        review_queue._batches.clear()
+        for key in review_queue._counters:
+            review_queue._counters[key] = 0
+
+
+@pytest.fixture(autouse=True)
+def clean_queue():
+    """用例之间不共享队列状态，重跑或调整顺序不影响结果"""
+    _reset_queue()
+    yield
+    # 完成回调在 result() 返回后才执行，等待名额释放后再清理
+    for _ in range(100):
+        if review_queue._active == 0:
+            break
+        time.sleep(0.01)
+    _reset_queue()
+
+
+def test_submit_review_runs_in_pool():
+    """测试审查任务提交到线程池执行，调用方立即拿到 Future"""
+    with patch('services.review.run_aider_review', return_value=None) as mock_review:
+        future = review_queue.submit_review("url", "main", "commit", {"commit_id": "abc"})
+        future.result(timeout=5)
+    
+    mock_review.assert_called_once_with("url", "main", "commit", {"commit_id": "abc"})
+
+
+def test_submit_review_rejects_when_full():
+    """测试队列已满时拒绝新任务，任务结束后释放名额"""
+    release = threading.Event()
+    with patch('services.review.run_aider_review', side_effect=lambda *a: release.wait(5)), \
+            patch.object(review_queue, '_capacity', 1):
+        future = review_queue.submit_review("url-a", "main", "commit", {"commit_id": "a"})
+        with pytest.raises(review_queue.QueueFullError):
+            review_queue.submit_review("url-b", "main", "commit", {"commit_id": "b"})
+        release.set()
+        future.result(timeout=5)
+
+    # 完成回调在 result() 返回后才执行，稍等名额释放
+    for _ in range(50):
+        if review_queue._active == 0:
+            break
+        time.sleep(0.01)
+    assert review_queue._active == 0
+
+
+def test_submit_review_coalesces_duplicates():
+    """测试重复触发：排队中的同一 MR 被新请求替换，执行中的同一 Commit 直接复用"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def fake_review(url, branch, strategy, context):
+        started.set()
+        release.wait(5)
+
+    commit_ctx = {"strategy": "commit", "platform": "gitlab", "project_id": "g/p", "commit_id": "abc"}
+    mr_ctx = {"strategy": "merge_request", "platform": "gitlab", "project_id": "g/p", "mr_iid": 7}
+    with patch('services.review.run_aider_review', side_effect=fake_review), \
+            patch.object(review_queue, '_executor', review_queue.ThreadPoolExecutor(max_workers=1)):
+        running = review_queue.submit_review("url", "main", "commit", commit_ctx)
+        assert started.wait(5)
+        assert review_queue.submit_review("url", "main", "commit", dict(commit_ctx)) is running
+
+        queued = review_queue.submit_review("url", "main", "merge_request", mr_ctx)
+        latest = review_queue.submit_review("url", "main", "merge_request", dict(mr_ctx))
+        assert queued.cancelled()
+        assert latest is not queued
+
+        release.set()
+        running.result(timeout=5)
+        latest.result(timeout=5)
+
+
+def test_queue_stats():
+    """测试队列状态：执行中、排队中的任务数与累计计数"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def fake_review(*args):
+        started.set()
+        release.wait(5)
+
+    before = review_queue.get_stats()
+    with patch('services.review.run_aider_review', side_effect=fake_review), \
+            patch.object(review_queue, '_executor', review_queue.ThreadPoolExecutor(max_workers=1)):
+        running = review_queue.submit_review("url-1", "main", "commit", {"commit_id": "s1"})
+        assert started.wait(5)
+        queued = review_queue.submit_review("url-2", "main", "commit", {"commit_id": "s2"})
+
+        stats = review_queue.get_stats()
+        assert stats["running"] == 1
+        assert stats["queued"] == 1
+        assert stats["submitted"] == before["submitted"] + 2
+
+        release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+
+
+def test_recently_completed_commit_skipped():
+    """测试刚审查完成的 Commit 在有效期内不再重复执行，HEAD 不受影响"""
+    ctx = {"strategy": "commit", "platform": "gitlab", "project_id": "g/p", "commit_id": "r1"}
+    with patch('services.review.run_aider_review', return_value=None) as mock_review:
+        review_queue.submit_review("url", "main", "commit", ctx).result(timeout=5)
+        for _ in range(50):
+            if review_queue._task_key(ctx) in review_queue._recent:
+                break
+            time.sleep(0.01)
+
+        assert review_queue.submit_review("url", "main", "commit", dict(ctx)).result(timeout=5) is None
+        assert mock_review.call_count == 1
+
+        head_ctx = {**ctx, "commit_id": "HEAD"}
+        review_queue.submit_review("url", "main", "commit", head_ctx).result(timeout=5)
+        review_queue.submit_review("url", "main", "commit", dict(head_ctx)).result(timeout=5)
+        assert mock_review.call_count == 3
+
+
+def test_run_aider_output_tail_and_terminate(tmp_path):
+    """测试 Aider 输出只保留末尾，服务停止时运行中的子进程被终止"""
+    cmd = [sys.executable, "-c", "print('x' * 100 + 'END')"]
+    with patch.object(review, '_MAX_OUTPUT_BYTES', 10):
+        result = review._run_aider(cmd, str(tmp_path), dict(os.environ), 10)
+    assert result.returncode == 0
+    assert result.stdout.endswith("END\n")
+    assert len(result.stdout) == 10
+
+    threading.Timer(0.2, review.terminate_running).start()
+    start = time.monotonic()
+    try:
+        with pytest.raises(review.ReviewCancelled):
+            review._run_aider([sys.executable, "-c", "import time; time.sleep(30)"], str(tmp_path), dict(os.environ), 30)
+        assert time.monotonic() - start < 10
+        assert not review._procs
+    finally:
+        review._stopping.clear()
+
+
+def test_commits_batched_while_queued():
+    """测试同一仓库分支排队中的 Commit 合并为一次审查，超出批量上限后另起任务"""
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def fake_review(url, branch, strategy, context):
+        calls.append(list(context.get('batch_commit_ids') or [context['commit_id']]))
+        started.set()
+        release.wait(5)
+
+    def ctx(commit_id):
+        return {"strategy": "commit", "platform": "gitlab", "project_id": "g/batch", "commit_id": commit_id}
+
+    with patch('services.review.run_aider_review', side_effect=fake_review), \
+            patch.object(review_queue, '_executor', review_queue.ThreadPoolExecutor(max_workers=1)), \
+            patch.object(review_queue, '_batch_size', 3):
+        running = review_queue.submit_review("url", "main", "commit", ctx("c0"))
+        assert started.wait(5)
+
+        batch = review_queue.submit_review("url", "main", "commit", ctx("c1"))
+        assert review_queue.submit_review("url", "main", "commit", ctx("c2")) is batch
+        assert review_queue.submit_review("url", "main", "commit", ctx("c3")) is batch
+        # 重复的 Commit 直接复用所在的任务
+        assert review_queue.submit_review("url", "main", "commit", ctx("c2")) is batch
+        overflow = review_queue.submit_review("url", "main", "commit", ctx("c4"))
+        assert overflow is not batch
+        other_branch = review_queue.submit_review("url", "dev", "commit", ctx("c5"))
+        assert other_branch is not batch
+
+        release.set()
+        for future in (running, batch, overflow, other_branch):
+            future.result(timeout=5)
+
+    assert calls == [["c0"], ["c1", "c2", "c3"], ["c4"], ["c5"]]
@@ -0,0 +1,44 @@
+"""
+统计接口测试
+"""
+import os
+import sys
+from unittest.mock import MagicMock
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import statistics
+from routes import stats
+
+
+def test_stats_cache_etag_and_invalidation():
+    """统计结果按数据版本缓存，ETag 匹配返回 304，审查数据变更后重新查询"""
+    request = MagicMock(headers={})
+    compute = MagicMock(return_value={"total_reviews": 1})
+    key = ("test-cache",)
+
+    first = stats._cached_stats(request, key, compute)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    stats._cached_stats(request, key, compute)
+    assert compute.call_count == 1
+
+    request.headers = {"if-none-match": etag}
+    assert stats._cached_stats(request, key, compute).status_code == 304
+
+    statistics.bump_data_version()
+    compute.return_value = {"total_reviews": 2}
+    refreshed = stats._cached_stats(request, key, compute)
+    assert compute.call_count == 2
+    assert refreshed.status_code == 200
+    assert refreshed.headers["etag"] != etag
+
+
+def test_delete_review_invalidates_cache():
+    """删除审查记录后数据版本递增，统计缓存失效"""
+    db = MagicMock()
+    version = statistics.get_data_version()
+    assert stats.delete_review("task-1", db) == {"status": "deleted", "task_id": "task-1"}
+    db.commit.assert_called_once()
+    assert statistics.get_data_version() == version + 1
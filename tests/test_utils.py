@@ -17,6 +17,7 @@ from utils import (
     filter_valid_files,
     format_review_comment,
     sanitize_branch_name,
+    extract_project_path,
     convert_to_http_auth_url,
     build_git_auth
 )
@@ -101,6 +102,24 @@ class TestSanitizeBranchName:
         assert sanitize_branch_name("develop") == "develop"
 
 
+class TestExtractProjectPath:
+    """测试项目路径提取"""
+    
+    def test_ssh_url(self):
+        """SSH URL应提取group/project"""
+        assert extract_project_path("git@gitlab.com:group/project.git") == "group/project"
+    
+    def test_http_url(self):
+        """HTTP URL应支持多级group"""
+        assert extract_project_path("https://gitlab.com/group/sub/project.git") == "group/sub/project"
+        assert extract_project_path("http://gitlab.com/group/project") == "group/project"
+    
+    def test_invalid_url(self):
+        """无法解析的URL返回None"""
+        assert extract_project_path("") is None
+        assert extract_project_path("not-a-url") is None
+
+
 class TestConvertToHttpAuthUrl:
     """测试URL转换"""
     
@@ -179,6 +198,18 @@ class TestPollingRepo:
         assert data["id"] == "test-id"
         assert data["name"] == "test-repo"
     
+    def test_polling_repo_to_dict_covers_all_fields(self):
+        """to_dict应包含所有字段并可往返还原"""
+        from dataclasses import fields
+        from polling import PollingRepo
+        
+        repo = PollingRepo(id="test-id", name="test-repo", url="u", last_mr_id=3)
+        data = repo.to_dict()
+        assert set(data) == {f.name for f in fields(PollingRepo) if f.init}
+        assert PollingRepo.from_dict(data) == repo
+        # 未知字段和运行时状态字段被忽略
+        assert PollingRepo.from_dict({**data, "unknown": 1, "_last_poll_ts": 5.0}) == repo
+    
     def test_polling_repo_from_dict(self):
         """测试PollingRepo反序列化"""
         from polling import PollingRepo
@@ -194,5 +225,59 @@ class TestPollingRepo:
         assert repo.branch == "develop"
 
 
+class TestAnalyzeIssues:
+    """测试报告问题计数"""
+
+    def test_counts_by_severity(self):
+        """三类关键词分别计数，大小写不敏感"""
+        from services.review import analyze_issues
+
+        report = "🔴 严重: SQL Error\n🟡 Warning: 注意边界\n🔵 建议优化, Recommend"
+        assert analyze_issues(report) == (3, 3, 4)
+        assert analyze_issues("") == (0, 0, 0)
+
+
+class TestSettingsCache:
+    """测试配置缓存"""
+
+    def test_typed_getters_read_snapshot(self):
+        """传入快照时不访问缓存和数据库"""
+        from settings import SettingsManager
+
+        snapshot = {"aider_timeout": "30", "enable_comment": "false"}
+        with patch.object(SettingsManager, "_cached", side_effect=AssertionError):
+            assert SettingsManager.get_int("aider_timeout", 600, snapshot) == 30
+            assert SettingsManager.get_bool("enable_comment", True, snapshot) is False
+            assert SettingsManager.get_int("missing", 7, snapshot) == 7
+
+    def test_cache_hit_and_invalidate(self):
+        """缓存有效期内只查询一次，写入后失效"""
+        from settings import SettingsManager
+
+        SettingsManager._cache_time = None
+        with patch.object(SettingsManager, "_get_session", wraps=SettingsManager._get_session) as get_session:
+            SettingsManager.get_all()
+            SettingsManager.get("git_platform")
+            SettingsManager.get_bool("enable_comment")
+            assert get_session.call_count == 1
+
+            SettingsManager._cache_time = None
+            SettingsManager.get_all()
+            assert get_session.call_count == 2
+    
+    def test_snapshot_parsed_and_reused(self):
+        """快照按类型解析，缓存未重新加载时复用同一对象"""
+        from settings import ReviewSettings, SettingsManager
+
+        snap = ReviewSettings.from_dict({"aider_timeout": "30", "enable_comment": "false", "aider_retry_count": "x"})
+        assert snap.aider_timeout == 30
+        assert snap.enable_comment is False
+        assert snap.aider_retry_count == 1
+
+        assert SettingsManager.snapshot() is SettingsManager.snapshot()
+        SettingsManager._cache_time = None
+        assert SettingsManager.snapshot().raw is SettingsManager._cache
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
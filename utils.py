@@ -3,7 +3,8 @@
 """
 import logging
 import re
-from typing import List, Optional
+from functools import lru_cache
+from typing import Iterable, List, Optional
 
 # 配置日志 - 仅配置本模块logger，避免影响其他模块
 logger = logging.getLogger("aider-reviewer")
@@ -13,6 +14,12 @@ if not logger.handlers:
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
 
+# Git仓库URL解析正则（预编译）
+# SSH格式: git@host:group/project.git
+_SSH_URL_RE = re.compile(r'git@[^:]+:(.+?)(?:\.git)?$')
+# HTTP格式: http(s)://host/group/project.git
+_HTTP_URL_RE = re.compile(r'https?://[^/]+/(.+?)(?:\.git)?$')
+
 
 def parse_aider_output(raw_output: str) -> str:
     """
@@ -56,41 +63,49 @@ def parse_aider_output(raw_output: str) -> str:
     return result
 
 
-def filter_valid_files(files: List[str], valid_extensions: List[str]) -> List[str]:
+# 排除的目录模式
+_EXCLUDED_DIRS = (
+    'node_modules/', 'vendor/', 'lib/', 'libs/', 'plugins/',
+    '.git/', '.svn/', 'dist/', 'build/', 'target/',
+    '__pycache__/', '.cache/', '.vscode/', '.idea/',
+    'static/platform/', 'static/lib/', 'static/vendor/',
+)
+
+# 排除的文件模式
+_EXCLUDED_FILES = (
+    '.min.js', '.min.css', '.bundle.js', '.chunk.js',
+    'jquery', 'bootstrap', 'vue.js', 'react.', 'angular.',
+    'lodash', 'moment', 'axios', 'echarts',
+    '.map', '.lock', 'package-lock.json', 'yarn.lock',
+)
+
+# 各模式合并为一个正则，每个文件一次扫描完成匹配（对小写路径匹配）
+_EXCLUDED_DIRS_RE = re.compile('|'.join(map(re.escape, _EXCLUDED_DIRS)))
+_EXCLUDED_FILES_RE = re.compile('|'.join(map(re.escape, _EXCLUDED_FILES)))
+
+
+def filter_valid_files(files: List[str], valid_extensions: Iterable[str]) -> List[str]:
     """
     过滤有效的代码文件
     排除第三方库、node_modules、vendor等目录
     """
-    # 排除的目录模式
-    EXCLUDED_DIRS = [
-        'node_modules/', 'vendor/', 'lib/', 'libs/', 'plugins/',
-        '.git/', '.svn/', 'dist/', 'build/', 'target/',
-        '__pycache__/', '.cache/', '.vscode/', '.idea/',
-        'static/platform/', 'static/lib/', 'static/vendor/',
-    ]
-    
-    # 排除的文件模式
-    EXCLUDED_FILES = [
-        '.min.js', '.min.css', '.bundle.js', '.chunk.js',
-        'jquery', 'bootstrap', 'vue.js', 'react.', 'angular.',
-        'lodash', 'moment', 'axios', 'echarts',
-        '.map', '.lock', 'package-lock.json', 'yarn.lock',
-    ]
+    # 扩展名按最后一个 '.' 切分后查 frozenset（config 中已是 frozenset 时直接使用）
+    exts = valid_extensions if isinstance(valid_extensions, frozenset) else frozenset(valid_extensions)
     
     result = []
     for f in files:
         # 检查扩展名
-        if not any(f.endswith(ext) for ext in valid_extensions):
+        if '.' + f.rpartition('.')[2] not in exts:
             continue
         
         # 检查排除目录
         f_lower = f.lower()
-        if any(excl in f_lower for excl in EXCLUDED_DIRS):
+        if _EXCLUDED_DIRS_RE.search(f_lower):
             logger.debug(f"排除库目录文件: {f}")
             continue
         
         # 检查排除文件模式
-        if any(excl in f_lower for excl in EXCLUDED_FILES):
+        if _EXCLUDED_FILES_RE.search(f_lower):
             logger.debug(f"排除库文件: {f}")
             continue
         
@@ -107,7 +122,11 @@ def format_review_comment(report: str, strategy: str, context: dict) -> str:
     
     if strategy == "commit":
         header += f"**审查类型**: Commit审查\n"
-        header += f"**Commit ID**: `{context.get('commit_id', 'N/A')}`\n\n"
+        header += f"**Commit ID**: `{context.get('commit_id', 'N/A')}`\n"
+        batch_ids = context.get('reviewed_commit_ids')
+        if batch_ids and len(batch_ids) > 1:
+            header += f"**合并审查的提交**: {', '.join(f'`{c[:8]}`' for c in batch_ids)}\n"
+        header += "\n"
     elif strategy == "merge_request":
         header += f"**审查类型**: Merge Request审查\n"
         header += f"**目标分支**: `{context.get('target_branch', 'N/A')}`\n\n"
@@ -418,25 +437,19 @@ def sanitize_branch_name(ref: str) -> str:
 
 
 
+@lru_cache(maxsize=256)
 def extract_project_path(url: str) -> Optional[str]:
     """
     从Git URL提取项目路径 (group/repo)
     支持 SSH 和 HTTP(S) 格式
+    
+    仓库URL基本不变，结果按URL缓存
     """
     if not url:
         return None
-        
-    # SSH格式: git@host:group/project.git
-    ssh_match = re.match(r'git@[^:]+:(.+?)(?:\.git)?$', url)
-    if ssh_match:
-        return ssh_match.group(1)
     
-    # HTTP格式: http(s)://host/group/project.git
-    http_match = re.match(r'https?://[^/]+/(.+?)(?:\.git)?$', url)
-    if http_match:
-        return http_match.group(1)
-    
-    return None
+    match = _SSH_URL_RE.match(url) or _HTTP_URL_RE.match(url)
+    return match.group(1) if match else None
 
 
 def convert_to_http_auth_url(repo_url: str, http_user: str = "", http_password: str = "", 
@@ -529,6 +542,14 @@ def convert_to_http_auth_url(repo_url: str, http_user: str = "", http_password:
     return repo_url
 
 
+# 各平台 API Token 认证请求头模板
+_TOKEN_HEADER_TEMPLATES = {
+    'gitlab': {"PRIVATE-TOKEN": "{token}"},
+    'gitea': {"Authorization": "token {token}"},
+    'github': {"Authorization": "Bearer {token}", "Accept": "application/vnd.github.v3+json"},
+}
+
+
 def build_git_auth(platform: str, token: str = '', http_user: str = '', http_password: str = '') -> dict:
     """
     构建Git API认证信息
@@ -542,14 +563,9 @@ def build_git_auth(platform: str, token: str = '', http_user: str = '', http_pas
     auth = None
     
     if token:
-        # 使用API Token认证
-        if platform == 'gitlab':
-            headers["PRIVATE-TOKEN"] = token
-        elif platform == 'gitea':
-            headers["Authorization"] = f"token {token}"
-        elif platform == 'github':
-            headers["Authorization"] = f"Bearer {token}"
-            headers["Accept"] = "application/vnd.github.v3+json"
+        # 使用API Token认证，按平台查表生成请求头
+        template = _TOKEN_HEADER_TEMPLATES.get(platform, {})
+        headers = {name: value.format(token=token) for name, value in template.items()}
     elif http_user and http_password:
         # 使用HTTP Basic认证
         auth = (http_user, http_password)